@@ -0,0 +1,96 @@
+import json
+import os
+import subprocess
+import time
+from contextlib import contextmanager
+
+# Helpers shared by the benchmark cells of the notebooks: per-stage timings, and results saved as JSON
+# (one file per run, named after the commit) so that runs of different commits can be compared.
+
+
+def percentile(values, q):
+    """q-th percentile (0-100) of a list of numbers, with linear interpolation."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+class StageTimer:
+    def __init__(self):
+        self.durations = {}  # Stage name -> list of durations in seconds
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations.setdefault(name, []).append(time.perf_counter() - start)
+
+    def summary(self):
+        """Count, total seconds and p50/p95 latency in milliseconds of every stage."""
+        return {
+            name: {
+                "count": len(durations),
+                "total_s": round(sum(durations), 4),
+                "p50_ms": round(percentile(durations, 50) * 1000, 3),
+                "p95_ms": round(percentile(durations, 95) * 1000, 3),
+            }
+            for name, durations in self.durations.items()
+        }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_benchmark_results(name, results, config=None, directory="out/benchmarks"):
+    """Writes the results of one benchmark run to <directory>/<name>-<commit>-<timestamp>.json and returns the path."""
+    os.makedirs(directory, exist_ok=True)
+    commit = git_commit()
+    timestamp = time.strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(directory, f"{name}-{commit or 'nocommit'}-{timestamp}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"name": name, "commit": commit, "timestamp": timestamp, "config": config or {}, "results": results}, f, indent=2)
+    return path
+
+
+# Size a run was measured at, depending on the benchmark: comments of a thread, topics of a snapshot, arguments of a topic
+SIZE_KEYS = ("n_comments", "n_topics", "n_arguments")
+
+
+def run_size(run):
+    """(key, value) of the size of a run, or None for runs measured at something else (e.g. worker pools)."""
+    key = next((key for key in SIZE_KEYS if key in run), None)
+    return None if key is None else (key, run[key])
+
+
+def compare_benchmark_results(old_path, new_path):
+    """Prints throughput, peak memory and per-stage p95 of two saved runs side by side, matched by size."""
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+    old_by_size = {run_size(run): run for run in old["results"]}
+    print(f"{old['commit']} -> {new['commit']}")
+    for run in new["results"]:
+        size = run_size(run)
+        before = old_by_size.get(size) if size is not None else None
+        if before is None:
+            continue
+        key, value = size
+        changes = [f"{before[field]:.1f} -> {run[field]:.1f} {field[:-len('_per_s')]}/s"
+                   for field in run if field.endswith("_per_s") and field in before]
+        if "peak_mib" in run and "peak_mib" in before:
+            changes.append(f"peak {before['peak_mib']:.1f} -> {run['peak_mib']:.1f} MiB")
+        print(f"{value} {key[len('n_'):]}: {', '.join(changes)}")
+        for stage, stats in run["stages"].items():
+            if stage in before["stages"]:
+                print(f"    {stage:>10}: p95 {before['stages'][stage]['p95_ms']:.2f} -> {stats['p95_ms']:.2f} ms")
@@ -0,0 +1,179 @@
+import threading
+from collections import OrderedDict
+
+# Hugging Face tokenizers of the local (Ollama) models; other models are counted with tiktoken
+HF_TOKENIZERS = {
+    "deepseek-r1:8b": "deepseek-ai/DeepSeek-R1-Distill-Llama-8B",
+    "llama3.1": "meta-llama/Llama-3.1-8B-Instruct",
+    "llama3.1:8b": "meta-llama/Llama-3.1-8B-Instruct",
+}
+
+# Tokens of parent context allowed in the extraction prompt, per model.
+# The local models run with Ollama's default context window, which also has to fit the prompt template,
+# the comment itself and the (thinking) answer; the OpenAI models have room for more context.
+CONTEXT_BUDGETS = {
+    "deepseek-r1:8b": 450,
+    "llama3.1": 600,
+    "llama3.1:8b": 600,
+    "gpt-4o": 1500,
+    "gpt-4o-mini": 1500,
+}
+DEFAULT_CONTEXT_BUDGET = 600
+
+CONTEXT_PREFIX = "*Context from previous user's comment:* "
+
+
+def _load_tokenizer(model, tokenizer=None):
+    """Returns (backend name, encode, decode) for the tokenizer of a model, or the word estimate if none can be loaded."""
+    name = tokenizer or HF_TOKENIZERS.get(model)
+    if name is not None:
+        try:
+            from transformers import AutoTokenizer
+            # Long comments are only counted, never fed to a model, so the length warning is disabled
+            hf_tokenizer = AutoTokenizer.from_pretrained(name, model_max_length=10**9)
+            return (
+                f"hf:{name}",
+                lambda text: hf_tokenizer.encode(text, add_special_tokens=False),
+                lambda ids: hf_tokenizer.decode(ids),
+            )
+        except Exception as e:
+            print(f"Could not load the tokenizer {name} ({type(e).__name__}), trying tiktoken.")
+    try:
+        import tiktoken
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            # Not an OpenAI model: cl100k_base is close to the Llama 3 vocabulary
+            encoding = tiktoken.get_encoding("cl100k_base")
+        return f"tiktoken:{encoding.name}", lambda text: encoding.encode(text, disallowed_special=()), encoding.decode
+    except Exception as e:
+        print(f"Could not load a tiktoken encoding ({type(e).__name__}), estimating tokens from words.")
+    return "estimate", None, None
+
+
+class TokenCounter:
+    def __init__(self, model, tokenizer=None, max_entries=50_000):
+        """
+        Counts tokens with the tokenizer of the target model (a Hugging Face tokenizer name or path can be given),
+        caching the count of each text. Falls back to words * 1.3 when no tokenizer is available.
+        """
+        self.model = model
+        self.backend, self._encode, self._decode = _load_tokenizer(model, tokenizer)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._counts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def count(self, text: str) -> int:
+        with self._lock:
+            count = self._counts.get(text)
+            if count is not None:
+                self._counts.move_to_end(text)
+                self.hits += 1
+                return count
+            self.misses += 1
+        count = len(self._encode(text)) if self._encode is not None else int(len(text.split()) * 1.3)
+        with self._lock:
+            self._counts[text] = count
+            if len(self._counts) > self.max_entries:
+                self._counts.popitem(last=False)
+        return count
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """First max_tokens tokens of a text."""
+        if max_tokens <= 0:
+            return ""
+        if self._encode is None:
+            return " ".join(text.split()[:int(max_tokens / 1.3)])
+        ids = self._encode(text)
+        return text if len(ids) <= max_tokens else self._decode(ids[:max_tokens])
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "backend": self.backend,
+            "cached_texts": len(self._counts),
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class ContextPacker:
+    def __init__(self, counter, summarize, budget=None, verbatim_tokens=150, min_tokens=24, prefix=CONTEXT_PREFIX):
+        """
+        Builds the parents' context of a prompt within a token budget (default: CONTEXT_BUDGETS of the counter's model).
+        Parents of up to verbatim_tokens tokens are kept as they are; longer ones are replaced by summarize(text)
+        when the summary is shorter. Parents are packed nearest first; the last one that fits is trimmed, and the
+        summarizer is not called for parents left without room (less than min_tokens).
+        """
+        self.counter = counter
+        self.summarize = summarize
+        self.budget = budget if budget is not None else CONTEXT_BUDGETS.get(counter.model, DEFAULT_CONTEXT_BUDGET)
+        self.verbatim_tokens = verbatim_tokens
+        self.min_tokens = min_tokens
+        self.prefix = prefix
+        self.totals = {"contexts": 0, "parents": 0, "verbatim": 0, "summarized": 0, "trimmed": 0, "dropped": 0,
+                       "raw_tokens": 0, "packed_tokens": 0}
+        self._lock = threading.Lock()
+
+    def _piece(self, text, verbatim_tokens):
+        """Text of a parent in the context: verbatim, or its summary when that is shorter."""
+        text = text.strip()
+        tokens = self.counter.count(text)
+        if tokens <= verbatim_tokens:
+            return text, tokens, "verbatim"
+        summary = self.summarize(text).strip()
+        summary_tokens = self.counter.count(summary)
+        if summary_tokens < tokens:
+            return summary, summary_tokens, "summarized"
+        return text, tokens, "verbatim"
+
+    def pack(self, parents, budget=None, verbatim_tokens=None):
+        """
+        Returns (context, report) for a list of parents ({"id", "text"} dicts, with an optional "depth").
+        The context keeps the order of the list; the report compares its tokens with the parents sent verbatim.
+        """
+        budget = self.budget if budget is None else budget
+        verbatim_tokens = self.verbatim_tokens if verbatim_tokens is None else verbatim_tokens
+        overhead = self.counter.count(self.prefix) + 1  # Prefix and line break
+        report = {"parents": len(parents), "verbatim": 0, "summarized": 0, "trimmed": 0, "dropped": 0,
+                  "raw_tokens": sum(overhead + self.counter.count(p["text"].strip()) for p in parents)}
+
+        remaining = budget
+        pieces = {}
+        priority = sorted(range(len(parents)), key=lambda i: parents[i].get("depth", i))
+        for i in priority:
+            room = remaining - overhead
+            if room < self.min_tokens and self.counter.count(parents[i]["text"].strip()) > room:
+                report["dropped"] += 1
+                continue
+            piece, tokens, kind = self._piece(parents[i]["text"], verbatim_tokens)
+            if tokens > room:
+                if room < self.min_tokens:
+                    report["dropped"] += 1
+                    continue
+                piece = self.counter.truncate(piece, room - 1).rstrip() + "…"
+                tokens = self.counter.count(piece)
+                report["trimmed"] += 1
+            report[kind] += 1
+            remaining -= overhead + tokens
+            pieces[i] = piece
+
+        context = "\n".join(f"{self.prefix}{pieces[i]}" for i in range(len(parents)) if i in pieces)
+        report["packed_tokens"] = self.counter.count(context) if context else 0
+        report["saved_tokens"] = report["raw_tokens"] - report["packed_tokens"]
+        with self._lock:
+            self.totals["contexts"] += 1
+            for name in ("parents", "verbatim", "summarized", "trimmed", "dropped", "raw_tokens", "packed_tokens"):
+                self.totals[name] += report[name]
+        return context, report
+
+    def stats(self):
+        """Totals of the contexts packed so far and the tokens saved against sending the parents verbatim."""
+        with self._lock:
+            totals = dict(self.totals)
+        totals["saved_tokens"] = totals["raw_tokens"] - totals["packed_tokens"]
+        totals["saved_share"] = totals["saved_tokens"] / totals["raw_tokens"] if totals["raw_tokens"] else 0.0
+        totals["budget"] = self.budget
+        totals["tokenizer"] = self.counter.stats()
+        return totals
@@ -0,0 +1,338 @@
+import hashlib
+import json
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+# Storage formats of the vector store: "float16" halves the size of float32 vectors, "int8" quarters it
+# (one float32 scale per vector); both keep cosine similarities of normalized vectors within about 1e-2
+STORE_DTYPES = ("float16", "int8")
+
+
+def text_key(text):
+    """Hash of a text, used as its key in the vector store."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class SentenceTransformerBackend:
+    def __init__(self, model, name=None, batch_size=64):
+        """Local SentenceTransformer model: an instance (name it, the name keys the vector store) or a model name such as 'all-MiniLM-L6-v2'."""
+        if isinstance(model, str):
+            from sentence_transformers import SentenceTransformer
+            name = name or model
+            model = SentenceTransformer(model)
+        self.model = model
+        self.batch_size = batch_size
+        self.name = name or type(model).__name__
+        self.dim = model.get_sentence_embedding_dimension()
+
+    def encode(self, texts):
+        # Texts are encoded in groups of similar length, so that short texts are not padded to the longest one of the batch
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = np.empty((len(texts), self.dim), dtype=np.float32)
+        start = 0
+        while start < len(order):
+            limit = 2 * max(len(texts[order[start]]), 64)
+            end = start + 1
+            while end < len(order) and end - start < self.batch_size and len(texts[order[end]]) <= limit:
+                end += 1
+            group = order[start:end]
+            vectors[group] = self.model.encode([texts[i] for i in group], batch_size=self.batch_size,
+                                               convert_to_numpy=True, normalize_embeddings=True)
+            start = end
+        return vectors
+
+
+class OllamaEmbeddingBackend:
+    def __init__(self, model="mxbai-embed-large", url="http://localhost:11434", timeout=120):
+        """Ollama embedding model, called through /api/embed with a whole batch per request."""
+        self.model = model
+        self.url = url.rstrip("/") + "/api/embed"
+        self.timeout = timeout
+        self.name = f"ollama/{model}"
+        self.dim = None  # Known after the first request
+
+    def encode(self, texts):
+        import requests
+        response = requests.post(self.url, json={"model": self.model, "input": list(texts)}, timeout=self.timeout)
+        response.raise_for_status()
+        vectors = _normalize(np.asarray(response.json()["embeddings"], dtype=np.float32))
+        self.dim = vectors.shape[1]
+        return vectors
+
+
+class EmbeddingStore:
+    def __init__(self, directory, dim, dtype="float16", initial_capacity=1024):
+        """
+        Append-only store of normalized vectors keyed by text hash, kept in memory-mapped files so that a large corpus
+        does not have to fit in RAM. Files: vectors.bin (dtype rows), scales.bin (int8 only), keys.txt (one hash per line).
+        A vector is written before its key, so a crash never leaves a key without its vector.
+        """
+        if dtype not in STORE_DTYPES:
+            raise ValueError(f"Unknown store dtype '{dtype}', expected one of {STORE_DTYPES}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.dim = dim
+        self.dtype = dtype
+        self._lock = threading.Lock()
+
+        meta_path = os.path.join(directory, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            if (meta["dim"], meta["dtype"]) != (dim, dtype):
+                raise ValueError(f"Store in {directory} holds {meta['dim']}-d {meta['dtype']} vectors, not {dim}-d {dtype}")
+        else:
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump({"dim": dim, "dtype": dtype}, f)
+
+        self.index = {}  # Text hash -> row
+        keys_path = os.path.join(directory, "keys.txt")
+        if os.path.exists(keys_path):
+            with open(keys_path, encoding="utf-8") as f:
+                for line in f:
+                    # A key cut short by a crash is dropped (its vector is simply written again)
+                    if len(line) == 65 and line.endswith("\n"):
+                        self.index.setdefault(line[:64], len(self.index))
+        self.size = len(self.index)
+        self._keys = open(keys_path, "a", encoding="utf-8")
+        if self._keys.tell() and self._keys_torn(keys_path):
+            self._keys.write("\n")
+        self.capacity = 0
+        self._open(max(initial_capacity, self.size))
+
+    @staticmethod
+    def _keys_torn(path):
+        with open(path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) != b"\n"
+
+    def _open(self, capacity):
+        """(Re)maps the files with room for capacity vectors; the files only ever grow."""
+        storage = np.float16 if self.dtype == "float16" else np.int8
+        self.vectors = self._map("vectors.bin", storage, (capacity, self.dim))
+        self.scales = self._map("scales.bin", np.float32, (capacity,)) if self.dtype == "int8" else None
+        self.capacity = capacity
+
+    def _map(self, name, dtype, shape):
+        path = os.path.join(self.directory, name)
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        with open(path, "ab") as f:
+            if f.tell() < nbytes:
+                f.truncate(nbytes)
+        return np.memmap(path, dtype=dtype, mode="r+", shape=shape)
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def add(self, keys, vectors):
+        """Appends vectors (float32, normalized) for the keys not stored yet."""
+        with self._lock:
+            new = [(key, vector) for key, vector in zip(keys, vectors) if key not in self.index]
+            if not new:
+                return
+            if self.size + len(new) > self.capacity:
+                self.vectors.flush()
+                # Grow geometrically so that appends stay amortized O(1)
+                self._open(max(self.capacity * 2, self.size + len(new)))
+            rows = np.asarray([vector for _, vector in new], dtype=np.float32)
+            start, end = self.size, self.size + len(new)
+            if self.dtype == "float16":
+                self.vectors[start:end] = rows.astype(np.float16)
+            else:
+                scales = np.maximum(np.abs(rows).max(axis=1), 1e-12) / 127.0
+                self.vectors[start:end] = np.round(rows / scales[:, None]).astype(np.int8)
+                self.scales[start:end] = scales
+                self.scales.flush()
+            self.vectors.flush()
+            self._keys.write("".join(key + "\n" for key, _ in new))
+            self._keys.flush()
+            for offset, (key, _) in enumerate(new):
+                self.index[key] = start + offset
+            self.size = end
+
+    def get(self, keys):
+        """Returns the float32 vectors of the keys (all of them must be stored)."""
+        with self._lock:
+            rows = np.fromiter((self.index[key] for key in keys), dtype=np.int64, count=len(keys))
+            vectors = np.asarray(self.vectors[rows], dtype=np.float32)
+            if self.dtype == "int8":
+                vectors *= self.scales[rows][:, None]
+        return vectors
+
+    def matrix(self):
+        """Every stored vector, as a float32 array."""
+        with self._lock:
+            vectors = self.vectors[:self.size]
+            if self.dtype == "int8":
+                return vectors.astype(np.float32) * self.scales[:self.size][:, None]
+            return vectors.astype(np.float32)
+
+    def close(self):
+        with self._lock:
+            self.vectors.flush()
+            if self.scales is not None:
+                self.scales.flush()
+            self._keys.close()
+
+
+class EmbeddingService:
+    def __init__(self, backend, store_directory="cache/embeddings", dtype="float16", max_batch_size=64, max_wait=0.01):
+        """
+        Shared embedding layer. Texts submitted by any number of callers (threads or asyncio tasks) are grouped into
+        micro-batches of up to max_batch_size texts, waiting at most max_wait seconds after the first one.
+        Vectors are stored in an EmbeddingStore (one per backend model, under store_directory), so a text is encoded once.
+        encode() follows SentenceTransformer.encode, so the service can replace the model in ArgumentIndex and the triage.
+        """
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.dtype = dtype
+        self.store_directory = store_directory
+        self.store = None  # Opened once the dimension is known (Ollama reports it with the first batch)
+        if getattr(backend, "dim", None):
+            self._open_store(backend.dim)
+        self.requests = 0
+        self.hits = 0
+        self.encoded = 0
+        self.batches = 0
+        self._pending = {}  # Text hash -> future, for texts queued or being encoded
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="embedding-service", daemon=True)
+        self._worker.start()
+
+    def _open_store(self, dim):
+        name = re.sub(r"[^\w.-]+", "_", self.backend.name)
+        self.store = EmbeddingStore(os.path.join(self.store_directory, f"{name}-{self.dtype}"), dim, dtype=self.dtype)
+
+    def get_sentence_embedding_dimension(self):
+        return self.store.dim if self.store is not None else self.backend.dim
+
+    def submit(self, text):
+        """Returns a Future with the vector of one text."""
+        key = text_key(text)
+        with self._lock:
+            self.requests += 1
+            if self.store is not None and key in self.store:
+                self.hits += 1
+                future = Future()
+                future.set_result(self.store.get([key])[0])
+                return future
+            future = self._pending.get(key)
+            if future is not None:
+                # Same text already queued by another caller
+                self.hits += 1
+                return future
+            if self._closed:
+                raise RuntimeError("EmbeddingService is closed")
+            future = self._pending[key] = Future()
+        self._queue.put((key, text))
+        return future
+
+    def embed(self, texts):
+        """Normalized float32 vectors of the texts, as one (len(texts), dim) array."""
+        if not texts:
+            return np.zeros((0, self.get_sentence_embedding_dimension() or 0), dtype=np.float32)
+        keys = [text_key(text) for text in texts]
+        # Stored texts are read in one go, the others go through the micro-batches
+        with self._lock:
+            stored = [i for i, key in enumerate(keys) if self.store is not None and key in self.store]
+            self.requests += len(stored)
+            self.hits += len(stored)
+        stored_rows = set(stored)
+        futures = {i: self.submit(text) for i, text in enumerate(texts) if i not in stored_rows}
+        rows = dict(zip(stored, self.store.get([keys[i] for i in stored]))) if stored else {}
+        rows.update({i: future.result() for i, future in futures.items()})
+        return np.stack([rows[i] for i in range(len(texts))])
+
+    async def aembed(self, texts):
+        import asyncio
+        futures = [asyncio.wrap_future(self.submit(text)) for text in texts]
+        return np.stack(await asyncio.gather(*futures))
+
+    def encode(self, texts, convert_to_tensor=False, normalize_embeddings=True, **kwargs):
+        """Drop-in for SentenceTransformer.encode (vectors are always normalized; batch_size is set by the service)."""
+        single = isinstance(texts, str)
+        vectors = self.embed([texts] if single else list(texts))
+        if convert_to_tensor:
+            import torch
+            vectors = torch.from_numpy(vectors)
+        return vectors[0] if single else vectors
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)  # Stop after this batch
+                    break
+                batch.append(item)
+            self._encode_batch(batch)
+
+    def _encode_batch(self, batch):
+        keys = [key for key, _ in batch]
+        try:
+            vectors = self.backend.encode([text for _, text in batch])
+            if self.store is None:
+                self._open_store(vectors.shape[1])
+            self.store.add(keys, vectors)
+            # Callers always get the stored (rounded) vectors, so results do not depend on whether a text was cached
+            vectors = self.store.get(keys)
+        except Exception as e:
+            with self._lock:
+                futures = [self._pending.pop(key) for key in keys]
+            for future in futures:
+                future.set_exception(e)
+            return
+        with self._lock:
+            self.encoded += len(batch)
+            self.batches += 1
+            futures = [self._pending.pop(key) for key in keys]
+        for future, vector in zip(futures, vectors):
+            future.set_result(vector)
+
+    def stats(self):
+        """Requests, store hits, texts encoded and mean micro-batch size for this session."""
+        return {
+            "backend": self.backend.name,
+            "requests": self.requests,
+            "hits": self.hits,
+            "encoded": self.encoded,
+            "batches": self.batches,
+            "mean_batch_size": round(self.encoded / self.batches, 1) if self.batches else 0.0,
+            "stored": len(self.store) if self.store is not None else 0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        self._queue.put(None)
+        self._worker.join()
+        if self.store is not None:
+            self.store.close()
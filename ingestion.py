@@ -0,0 +1,373 @@
+import itertools
+import json
+import math
+import os
+import queue
+import threading
+import time
+
+# Batch ingestion of many threads: scraping, extraction and upload in worker pools connected by bounded queues.
+# The pipeline steps (scraper, extraction, writer, triage) are passed in by main.ipynb.
+
+
+def thread_id_from_url(thread_url: str) -> str:
+    parts = thread_url.rstrip("/").split("/")
+    return parts[parts.index("comments") + 1]
+
+
+def list_subreddit_threads(reddit, subreddit: str, limit: int = 100, sort: str = "new", rate_limiter=None):
+    """Threads of a subreddit listing ("new", "hot", "top", ...) with their creation time, one API request per page of 100."""
+    listing = iter(getattr(reddit.subreddit(subreddit), sort)(limit=limit))
+    threads = []
+    while True:
+        if len(threads) % 100 == 0 and rate_limiter is not None:
+            rate_limiter.acquire()
+        submission = next(listing, None)
+        if submission is None:
+            return threads
+        threads.append({
+            "url": "https://www.reddit.com" + submission.permalink,
+            "id": submission.id,
+            "created_utc": submission.created_utc,
+            "num_comments": submission.num_comments,
+        })
+
+
+class ThreadProgress:
+    def __init__(self, index: int, url: str, created_utc: float = None):
+        """Per-thread counters of the batch ingestion (updated by the workers of every stage)."""
+        self.index = index
+        self.url = url
+        self.id = thread_id_from_url(url)
+        self.created_utc = created_utc
+        self.title = None
+        self.tree = None  # Comment tree of the thread, filled while it is scraped (parents of the comments in the queues)
+        self.status = "queued"
+        self.error = None
+        self.scraped = 0
+        self.extracted = 0
+        self.skipped = 0
+        self.errors = 0
+        self.uploaded = 0
+        self.scrape_done = False
+        self.started = None
+        self.finished = None
+        self.lock = threading.Lock()
+
+    def as_dict(self):
+        return {
+            "url": self.url,
+            "title": self.title,
+            "created_utc": self.created_utc,
+            "status": self.status,
+            "error": self.error,
+            "scraped": self.scraped,
+            "extracted": self.extracted,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "uploaded": self.uploaded,
+            "seconds": round(self.finished - self.started, 2) if self.started and self.finished else None,
+        }
+
+
+class IngestionScheduler:
+    """
+    Batch ingestion of many threads. Scraping, extraction and upload run in separate worker pools connected by
+    bounded queues, so a slow stage holds the previous one back (backpressure) instead of filling memory:
+    scrapers stream the comments of their thread (Reddit requests go through one shared rate limiter) into the
+    extraction queue (triaged in batches of triage_batch comments), extractors retrieve the context and
+    extract/deduplicate the arguments, and uploaders write them with a writer each (every thread is always
+    uploaded by the same worker, so replies are linked to parents flushed earlier). With prioritize_fresh, the most
+    recently created threads are scraped first and their comments jump ahead in the extraction queue. Progress is
+    kept per thread and saved to progress_path; threads finished in an earlier run are skipped (an interrupted thread
+    is ingested again from the start: the uploaders' writers keep no run journal, which only applies to the main loops).
+
+    The steps of the pipeline are passed in:
+    - make_scraper(): a new scraper for one thread (iter_comments(url, more_budget=, keep_tree=True) and comment_tree)
+    - extract(record, thread_id, tree, skip_reason): graph documents of one comment, called by every extractor at once
+    - make_writer(): a new writer for one uploader (add_comment, add_graph_documents, responds_to, flush)
+    - triage(records): {comment id: skip reason}, called by every scraper at once; None sends every comment to extract
+    """
+    def __init__(self, reddit, rate_limiter, make_scraper, extract, make_writer, triage=None, models=(None, None),
+                 n_scrapers: int = 2, n_extractors: int = 2, n_uploaders: int = 2, queue_size: int = 64, upload_batch: int = 200,
+                 prioritize_fresh: bool = True, more_budget: int = None, max_comments_per_thread: int = None, triage_batch: int = 32,
+                 progress_path: str = "out/ingestion/progress.json", report_every: float = 10.0):
+        self.reddit = reddit
+        self.rate_limiter = rate_limiter
+        self.make_scraper = make_scraper
+        self.extract = extract
+        self.make_writer = make_writer
+        self.triage = triage
+        self.models = models  # (argument model, motivation model) stored on the arguments
+        self.n_scrapers = n_scrapers
+        self.n_extractors = n_extractors
+        self.n_uploaders = n_uploaders
+        self.queue_size = queue_size
+        self.upload_batch = upload_batch
+        self.prioritize_fresh = prioritize_fresh
+        self.more_budget = more_budget
+        self.max_comments_per_thread = max_comments_per_thread
+        self.triage_batch = triage_batch
+        self.progress_path = progress_path
+        self.report_every = report_every
+        self.threads = []
+        self.stage_seconds = {}  # (stage, "busy" | "blocked") -> seconds, blocked = waiting for room in the next queue
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def _add_seconds(self, stage, kind, seconds):
+        with self._lock:
+            self.stage_seconds[(stage, kind)] = self.stage_seconds.get((stage, kind), 0.0) + seconds
+
+    def _put(self, stage, target_queue, item):
+        start = time.perf_counter()
+        target_queue.put(item)
+        self._add_seconds(stage, "blocked", time.perf_counter() - start)
+
+    def _priority(self, thread):
+        # Newest threads first; threads without a creation time (plain URLs) keep their order, after the dated ones
+        if self.prioritize_fresh and thread.created_utc is not None:
+            return -thread.created_utc
+        return 0.0
+
+    def load_progress(self):
+        if self.progress_path and os.path.exists(self.progress_path):
+            with open(self.progress_path, encoding="utf-8") as f:
+                return json.load(f)
+        return {}
+
+    def save_progress(self):
+        if not self.progress_path:
+            return
+        with self._lock:
+            saved = self.load_progress()
+            saved.update({thread.id: thread.as_dict() for thread in self.threads if thread.status != "queued"})
+            directory = os.path.dirname(self.progress_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.progress_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(saved, f, indent=2)
+            os.replace(self.progress_path + ".tmp", self.progress_path)
+
+    # --- stages ---
+
+    def _send(self, priority, thread, records, extract_queue):
+        # Triage the scraped comments in one batch (one embedding call) and queue them with their skip reason
+        skipped = {}
+        try:
+            if self.triage is not None:
+                skipped = self.triage([record for record in records if record["text"]])
+        except Exception as e:
+            # The comments are still extracted, without triage
+            print(f"❌ Triage of {len(records)} comments of {thread.url} failed: {e}")
+        for record in records:
+            self._put("scrape", extract_queue, (priority, next(self._seq), thread, record, skipped.get(record["id"])))
+
+    def _scrape_worker(self, thread_queue, extract_queue):
+        while True:
+            try:
+                priority, _, thread = thread_queue.get_nowait()
+            except queue.Empty:
+                return
+            thread.status = "scraping"
+            thread.started = time.time()
+            scraper = self.make_scraper()
+            start = time.perf_counter()
+            records = []
+            try:
+                for record in scraper.iter_comments(thread.url, more_budget=self.more_budget, keep_tree=True):
+                    if record["parent_id"] is None:
+                        thread.title = record["title"]
+                        thread.tree = scraper.comment_tree
+                    with thread.lock:
+                        thread.scraped += 1
+                    records.append(record)
+                    if len(records) >= self.triage_batch:
+                        self._send(priority, thread, records, extract_queue)
+                        records = []
+                    if self.max_comments_per_thread is not None and thread.scraped >= self.max_comments_per_thread:
+                        break
+            except Exception as e:
+                print(f"❌ Scraping {thread.url} failed: {e}")
+                thread.error = f"{type(e).__name__}: {e}"
+            self._send(priority, thread, records, extract_queue)
+            self._add_seconds("scrape", "busy", time.perf_counter() - start)
+            with thread.lock:
+                thread.scrape_done = True
+                if thread.status == "scraping":
+                    thread.status = "extracting"
+                finished = thread.uploaded == thread.scraped
+            if finished:
+                self._finish(thread)
+
+    def _extract(self, thread, record, skip_reason=None):
+        """Graph documents of one comment (skip_reason: set by the triage)."""
+        if skip_reason:
+            with thread.lock:
+                thread.skipped += 1
+        return self.extract(record, thread.id, thread.tree, skip_reason)
+
+    def _extract_worker(self, extract_queue, upload_queues):
+        while True:
+            _, _, thread, record, skip_reason = extract_queue.get()
+            if thread is None:
+                return
+            start = time.perf_counter()
+            try:
+                documents = self._extract(thread, record, skip_reason)
+            except Exception as e:
+                # The comment is still uploaded, without arguments
+                print(f"❌ Extraction of comment {record['id']} failed: {e}")
+                documents = []
+                with thread.lock:
+                    thread.errors += 1
+            with thread.lock:
+                thread.extracted += 1
+            self._add_seconds("extract", "busy", time.perf_counter() - start)
+            self._put("extract", upload_queues[thread.index % len(upload_queues)], (thread, record, documents))
+
+    def _upload_worker(self, upload_queue):
+        writer = self.make_writer()
+        written = {}   # Thread id -> (thread, ids of its posts/comments flushed so far)
+        deferred = []  # (thread, RESPONDS_TO row) of replies whose parent was not flushed yet
+        pending = []   # (thread, record, documents) collected since the last flush
+
+        def flush():
+            nonlocal deferred, pending
+            start = time.perf_counter()
+            rows = list(deferred)
+            for thread, record, documents in pending:
+                writer.add_comment(record, thread.title)
+                writer.add_graph_documents(documents, *self.models)
+                written.setdefault(thread.id, (thread, set()))[1].add(record["id"])
+                if record["parent_id"] is not None:
+                    rows.append((thread, {"child_id": record["id"], "parent_id": record["parent_id"]}))
+            # Extraction finishes out of order: a reply is linked once its parent is in the graph
+            writer.responds_to = [row for thread, row in rows if row["parent_id"] in written[thread.id][1]]
+            deferred = [(thread, row) for thread, row in rows if row["parent_id"] not in written[thread.id][1]]
+            writer.flush()
+            self._add_seconds("upload", "busy", time.perf_counter() - start)
+
+            for thread, _, _ in pending:
+                with thread.lock:
+                    thread.uploaded += 1
+                    finished = thread.scrape_done and thread.uploaded == thread.scraped
+                if finished:
+                    self._finish(thread)
+            pending = []
+            # Finished threads are forgotten; their replies left waiting have no uploaded parent (e.g. replies to AutoModerator)
+            finished_ids = {thread_id for thread_id, (thread, _) in written.items() if thread.status in ("done", "failed")}
+            deferred = [(thread, row) for thread, row in deferred if thread.id not in finished_ids]
+            for thread_id in finished_ids:
+                del written[thread_id]
+
+        while True:
+            try:
+                thread, record, documents = upload_queue.get(timeout=0.5)
+            except queue.Empty:
+                if pending:
+                    flush()
+                continue
+            if thread is None:
+                if pending:
+                    flush()
+                return
+            pending.append((thread, record, documents))
+            # Flush full batches, and the last comment of a thread right away so that the thread completes
+            last = thread.scrape_done and thread.extracted == thread.scraped
+            if len(pending) >= self.upload_batch or last:
+                flush()
+
+    def _finish(self, thread):
+        with thread.lock:
+            if thread.status in ("done", "failed"):
+                return
+            thread.status = "failed" if thread.error else "done"
+            thread.finished = time.time()
+            thread.tree = None  # Every comment was extracted, the tree is not needed for contexts anymore
+        self.save_progress()
+        print(f"{'✅' if thread.status == 'done' else '❌'} {thread.id}: {thread.uploaded} posts/comments, "
+              f"{thread.skipped} skipped by the triage, {thread.errors} extraction errors, {thread.finished - thread.started:.1f}s")
+
+    # --- scheduling ---
+
+    def _start(self, n, target, *args):
+        workers = [threading.Thread(target=target, args=args, daemon=True) for _ in range(n)]
+        for worker in workers:
+            worker.start()
+        return workers
+
+    def _wait(self, workers, extract_queue, upload_queues):
+        last_report = time.perf_counter()
+        for worker in workers:
+            while worker.is_alive():
+                worker.join(timeout=0.5)
+                if self.report_every and time.perf_counter() - last_report >= self.report_every:
+                    last_report = time.perf_counter()
+                    print(self.status_line(extract_queue, upload_queues))
+
+    def status_line(self, extract_queue=None, upload_queues=()):
+        counts = {status: sum(thread.status == status for thread in self.threads) for status in ("done", "failed")}
+        queues = f", queues: extract {extract_queue.qsize()}, upload {sum(q.qsize() for q in upload_queues)}" if extract_queue is not None else ""
+        return (f"Threads {counts['done']}/{len(self.threads)} done ({counts['failed']} failed), "
+                f"comments scraped {sum(t.scraped for t in self.threads)}, extracted {sum(t.extracted for t in self.threads)}, "
+                f"uploaded {sum(t.uploaded for t in self.threads)}{queues}")
+
+    def run(self, threads=None, subreddit: str = None, limit: int = 100, sort: str = "new"):
+        """
+        Ingests a list of threads (URLs, or dicts with "url" and optionally "created_utc") or the first limit threads
+        of a subreddit listing. Returns the report of the run (see report()).
+        """
+        if subreddit is not None:
+            threads = list_subreddit_threads(self.reddit, subreddit, limit=limit, sort=sort, rate_limiter=self.rate_limiter)
+        done = {thread_id for thread_id, saved in self.load_progress().items() if saved["status"] == "done"}
+        self.threads = []
+        for entry in threads:
+            entry = {"url": entry} if isinstance(entry, str) else entry
+            if thread_id_from_url(entry["url"]) not in done:
+                self.threads.append(ThreadProgress(len(self.threads), entry["url"], entry.get("created_utc")))
+        print(f"Ingesting {len(self.threads)} threads ({len(done)} already done in earlier runs) with {self.n_scrapers} scrapers, "
+              f"{self.n_extractors} extractors and {self.n_uploaders} uploaders ...")
+
+        thread_queue = queue.PriorityQueue()
+        for thread in self.threads:
+            thread_queue.put((self._priority(thread), next(self._seq), thread))
+        extract_queue = queue.PriorityQueue(maxsize=self.queue_size)
+        upload_queues = [queue.Queue(maxsize=self.queue_size) for _ in range(self.n_uploaders)]
+
+        self.stage_seconds = {}
+        start = time.perf_counter()
+        scrapers = self._start(self.n_scrapers, self._scrape_worker, thread_queue, extract_queue)
+        extractors = self._start(self.n_extractors, self._extract_worker, extract_queue, upload_queues)
+        uploaders = [worker for upload_queue in upload_queues for worker in self._start(1, self._upload_worker, upload_queue)]
+
+        # Each pool stops once the previous one is done and its queue is drained
+        self._wait(scrapers, extract_queue, upload_queues)
+        for _ in extractors:
+            extract_queue.put((math.inf, next(self._seq), None, None, None))
+        self._wait(extractors, extract_queue, upload_queues)
+        for upload_queue in upload_queues:
+            upload_queue.put((None, None, None))
+        self._wait(uploaders, extract_queue, upload_queues)
+        self.seconds = time.perf_counter() - start
+        print(self.status_line())
+        return self.report()
+
+    def progress(self):
+        """Counters and status of every thread of the current run."""
+        return {thread.id: thread.as_dict() for thread in self.threads}
+
+    def report(self):
+        comments = sum(thread.uploaded for thread in self.threads)
+        return {
+            "threads": len(self.threads),
+            "done": sum(thread.status == "done" for thread in self.threads),
+            "failed": sum(thread.status == "failed" for thread in self.threads),
+            "comments": comments,
+            "skipped": sum(thread.skipped for thread in self.threads),
+            "errors": sum(thread.errors for thread in self.threads),
+            "seconds": round(self.seconds, 3),
+            "comments_per_s": round(comments / self.seconds, 2) if self.seconds else 0.0,
+            "rate_limit_wait_s": round(self.rate_limiter.waited, 3),
+            "stage_seconds": {f"{stage}_{kind}": round(seconds, 3) for (stage, kind), seconds in sorted(self.stage_seconds.items())},
+        }
@@ -0,0 +1,201 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from langchain_core.messages import AIMessage
+
+# "read_through": return cached responses and call the LLM (and store its answer) on a miss
+# "replay": only return cached responses, a miss raises CacheMissError (benchmarks and regression tests without Ollama/OpenAI)
+# "off": always call the LLM
+CACHE_MODES = ("read_through", "replay", "off")
+
+
+class CacheMissError(KeyError):
+    """Raised in replay mode when a prompt has no cached response."""
+
+
+class LLMResponseCache:
+    def __init__(self, path="cache/llm_responses.sqlite", mode="read_through"):
+        """Opens (or creates) a content-addressed cache of LLM responses."""
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode '{mode}', expected one of {CACHE_MODES}")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self.saved_latency = 0.0  # Seconds the cached calls originally took
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT NOT NULL,
+                latency REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model, prompt, params=None):
+        """Hash of the model name, the rendered prompt and the call parameters."""
+        payload = json.dumps({"model": model, "prompt": prompt, "params": params or {}}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Returns the cached response (a dict), or None. Raises CacheMissError on a miss in replay mode."""
+        if self.mode == "off":
+            return None
+        with self._lock:
+            row = self._conn.execute("SELECT response, latency FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.saved_latency += row[1]
+        if row is None:
+            if self.mode == "replay":
+                raise CacheMissError(key)
+            return None
+        return json.loads(row[0])
+
+    def put(self, key, model, response, latency):
+        if self.mode == "off":
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, latency) VALUES (?, ?, ?, ?)",
+                (key, model, json.dumps(response, default=str), latency)
+            )
+            self._conn.commit()
+
+    def stats(self):
+        """Returns hit rate and saved latency for this session."""
+        total = self.hits + self.misses
+        return {
+            "mode": self.mode,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "saved_latency_s": round(self.saved_latency, 2),
+        }
+
+    def close(self):
+        self._conn.close()
+
+
+def _model_identity(llm):
+    """Model name and parameters of a LangChain chat model (ChatOllama, ChatOpenAI)."""
+    model = getattr(llm, "model", None) or getattr(llm, "model_name", None) or type(llm).__name__
+    params = getattr(llm, "_identifying_params", {})
+    return model, params
+
+
+class CachedChain:
+    def __init__(self, runnable, cache):
+        """
+        Wraps a 'prompt | llm' chain, or a chat model called with a plain string, with the response cache.
+        Exposes invoke/ainvoke (returning an AIMessage) and stream/astream like the wrapped runnable.
+        """
+        self.runnable = runnable
+        self.cache = cache
+        # A RunnableSequence has a prompt as its first step and the model as its last
+        self.prompt = getattr(runnable, "first", None)
+        self.model, self.params = _model_identity(getattr(runnable, "last", runnable))
+
+    def _key(self, input):
+        rendered = self.prompt.invoke(input).to_string() if self.prompt is not None else str(input)
+        return self.cache.make_key(self.model, rendered, self.params)
+
+    @staticmethod
+    def _to_message(response):
+        # Only cached answers are built here: "cache_hit" tells the callers that no model was called
+        return AIMessage(
+            content=response["content"],
+            usage_metadata=response.get("usage_metadata"),
+            response_metadata={**(response.get("response_metadata") or {}), "cache_hit": True},
+        )
+
+    @staticmethod
+    def _to_record(message):
+        return {
+            "content": message.content,
+            "usage_metadata": getattr(message, "usage_metadata", None),
+            "response_metadata": getattr(message, "response_metadata", None),
+        }
+
+    def invoke(self, input, config=None, **kwargs):
+        key = self._key(input)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return self._to_message(cached)
+        start = time.perf_counter()
+        message = self.runnable.invoke(input, config, **kwargs)
+        self.cache.put(key, self.model, self._to_record(message), time.perf_counter() - start)
+        return message
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        key = self._key(input)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return self._to_message(cached)
+        start = time.perf_counter()
+        message = await self.runnable.ainvoke(input, config, **kwargs)
+        self.cache.put(key, self.model, self._to_record(message), time.perf_counter() - start)
+        return message
+
+    def stream(self, input, config=None, **kwargs):
+        """Streams the answer chunk by chunk; a cached answer comes as a single chunk."""
+        key = self._key(input)
+        cached = self.cache.get(key)
+        if cached is not None:
+            yield self._to_message(cached)
+            return
+        start = time.perf_counter()
+        message = None
+        for chunk in self.runnable.stream(input, config, **kwargs):
+            message = chunk if message is None else message + chunk
+            yield chunk
+        if message is not None:
+            self.cache.put(key, self.model, self._to_record(message), time.perf_counter() - start)
+
+    async def astream(self, input, config=None, **kwargs):
+        key = self._key(input)
+        cached = self.cache.get(key)
+        if cached is not None:
+            yield self._to_message(cached)
+            return
+        start = time.perf_counter()
+        message = None
+        async for chunk in self.runnable.astream(input, config, **kwargs):
+            message = chunk if message is None else message + chunk
+            yield chunk
+        if message is not None:
+            self.cache.put(key, self.model, self._to_record(message), time.perf_counter() - start)
+
+
+def is_cache_hit(message):
+    """True if the message was answered from the cache by CachedChain."""
+    return bool((getattr(message, "response_metadata", None) or {}).get("cache_hit"))
+
+
+def cached_openai_chat(cache, client, **request):
+    """Cached version of client.chat.completions.create(**request) for the raw OpenAI client. Returns the message content."""
+    model = request.get("model")
+    params = {k: v for k, v in request.items() if k not in ("model", "messages")}
+    key = cache.make_key(model, request.get("messages"), params)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached["content"]
+    start = time.perf_counter()
+    response = client.chat.completions.create(**request)
+    content = response.choices[0].message.content
+    cache.put(key, model, {"content": content}, time.perf_counter() - start)
+    return content
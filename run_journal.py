@@ -0,0 +1,121 @@
+import json
+import os
+import time
+
+# Stages recorded for each comment, in the order the processing loop goes through them
+STAGES = ("context", "extraction", "dedup", "upload")
+
+
+class RunJournal:
+    def __init__(self, run_id, directory="cache/runs", sync_every=50, sync_interval=2.0):
+        """
+        Opens (or creates) the append-only journal of a run, usually one per thread (run_id = thread id).
+        Every entry is one JSON line; the file is flushed and fsynced every sync_every entries or
+        sync_interval seconds, whichever comes first, and on sync()/close().
+        Entries already in the file are replayed, so a re-run knows which comments are done.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.run_id = run_id
+        self.path = os.path.join(directory, f"{run_id}.jsonl")
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.comments = {}  # comment id -> {stage: value}
+        self.order = []     # Comment ids in the order they were first seen
+        self._load()
+        self._file = open(self.path, "a", encoding="utf-8")
+        if self._torn:
+            # Start after the cut line instead of completing it
+            self._file.write("\n")
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def _load(self):
+        self._torn = False
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                self._torn = not line.endswith("\n")
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Last line cut short by a crash: its stage simply runs again
+                    continue
+                self._apply(entry)
+
+    def _apply(self, entry):
+        comment_id = entry["comment_id"]
+        if comment_id not in self.comments:
+            self.comments[comment_id] = {}
+            self.order.append(comment_id)
+        if entry["stage"] == "reset":
+            self.comments[comment_id] = {}
+        else:
+            self.comments[comment_id][entry["stage"]] = entry["value"]
+
+    def record(self, comment_id, stage, value):
+        """Appends the result of one stage for one comment."""
+        if stage not in STAGES:
+            raise ValueError(f"Unknown stage '{stage}', expected one of {STAGES}")
+        self._append({"comment_id": comment_id, "stage": stage, "value": value, "time": time.time()})
+
+    def reset(self, comment_id):
+        """Forgets the stages of a comment (e.g. edited since it was processed), so that the next run processes it again."""
+        self._append({"comment_id": comment_id, "stage": "reset", "value": None, "time": time.time()})
+
+    def _append(self, entry):
+        self._apply(entry)
+        self._file.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+        self._pending += 1
+        if self._pending >= self.sync_every or time.monotonic() - self._last_sync >= self.sync_interval:
+            self.sync()
+
+    def sync(self):
+        """Writes the buffered entries to disk."""
+        if self._pending == 0:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def get(self, comment_id, stage):
+        """Returns the recorded value of a stage, or None if it has not been done."""
+        return self.comments.get(comment_id, {}).get(stage)
+
+    def has(self, comment_id, stage):
+        return stage in self.comments.get(comment_id, {})
+
+    def is_done(self, comment_id):
+        return self.get(comment_id, "upload") == "done"
+
+    def first_pending(self, comment_ids):
+        """Returns the first comment id (in the given order) that is not done, or None."""
+        return next((comment_id for comment_id in comment_ids if not self.is_done(comment_id)), None)
+
+    def progress(self, comment_ids=None):
+        """Number of comments that reached each stage, out of comment_ids (default: every comment in the journal)."""
+        comment_ids = self.order if comment_ids is None else list(comment_ids)
+        counts = {stage: 0 for stage in STAGES}
+        for comment_id in comment_ids:
+            for stage in self.comments.get(comment_id, {}):
+                counts[stage] += 1
+        done = sum(self.is_done(comment_id) for comment_id in comment_ids)
+        return {
+            "run_id": self.run_id,
+            "comments": len(comment_ids),
+            "stages": counts,
+            "done": done,
+            "remaining": len(comment_ids) - done,
+            "next": self.first_pending(comment_ids),
+        }
+
+    def close(self):
+        self.sync()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
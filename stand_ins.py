@@ -0,0 +1,789 @@
+import asyncio
+import math
+import random
+import re
+import threading
+import time
+from array import array
+from collections import deque
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.runnables import Runnable
+
+# Local stand-ins for the external services used by the notebooks (Reddit API, Ollama/OpenAI, Neo4j),
+# so that the pipeline can be exercised and measured without them. Everything is deterministic.
+
+WORDS = (
+    "government policy tax health education climate war economy freedom people country law "
+    "security rights vote election public money jobs future community history energy market "
+    "should because therefore believe think would could never always more less better worse"
+).split()
+
+
+class FakeRedditor:
+    def __init__(self, name):
+        self.name = name
+
+    def __eq__(self, other):
+        # PRAW compares redditors with plain usernames, e.g. comment.author != "AutoModerator"
+        if isinstance(other, str):
+            return self.name.lower() == other.lower()
+        return isinstance(other, FakeRedditor) and self.name.lower() == other.name.lower()
+
+    def __hash__(self):
+        return hash(self.name.lower())
+
+
+class FakeComment:
+    def __init__(self, thread, index, depth, submission=None):
+        self._thread = thread
+        self._index = index
+        self._depth = depth
+        self._replies = None
+        self.submission = submission
+        self.id = thread.comment_id(index)
+        parent = thread.parents[index]
+        self.parent_id = f"t3_{thread.id}" if parent < 0 else f"t1_{thread.comment_id(parent)}"
+        self.body = thread.comment_text(index)
+        self.author = thread.comment_author(index)
+
+    @property
+    def replies(self):
+        # Loaded lazily, like a PRAW comment whose replies came with the listing
+        if self._replies is None:
+            self._replies = self._thread.forest(self._index, self._depth + 1, self.submission)
+        return self._replies
+
+
+class FakeMoreComments:
+    def __init__(self, thread, children, submission=None):
+        self._thread = thread
+        self.children = children
+        self.count = len(children)
+        self.submission = submission
+
+    def comments(self, update=True):
+        """
+        Fetches the next page of hidden comments (one 'load more comments' request). Like PRAW, the loaded comments and
+        stubs only get the submission with update=True, and a stub without submission cannot be expanded.
+        """
+        assert self.submission is not None, "MoreComments has no submission"
+        self._thread.request()
+        submission = self.submission if update else None
+        page, rest = self.children[:self._thread.more_page_size], self.children[self._thread.more_page_size:]
+        items = [FakeComment(self._thread, index, 0, submission) for index in page]
+        if rest:
+            items.append(FakeMoreComments(self._thread, rest, submission))
+        return items
+
+
+class FakeCommentForest:
+    def __init__(self, thread, items):
+        self._thread = thread
+        self._items = items
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def replace_more(self, limit=32):
+        """Expands (up to limit) or drops the MoreComments stubs, like PRAW's CommentForest.replace_more."""
+        expanded = 0
+        forests = deque([self])
+        while forests:
+            forest = forests.popleft()
+            pending = deque(forest._items)
+            items = []
+            while pending:
+                item = pending.popleft()
+                if isinstance(item, FakeMoreComments):
+                    if limit is None or expanded < limit:
+                        expanded += 1
+                        pending.extend(item.comments())
+                    continue
+                items.append(item)
+                forests.append(item.replies)
+            forest._items = items
+        return []
+
+    def list(self):
+        result = []
+        queue = deque(self._items)
+        while queue:
+            item = queue.popleft()
+            result.append(item)
+            if isinstance(item, FakeComment):
+                queue.extend(item.replies)
+        return result
+
+
+class FakeSubmission:
+    def __init__(self, thread):
+        self._thread = thread
+        self.id = thread.id
+        self.title = f"Synthetic thread {thread.id} about {thread.rng.choice(WORDS)}?"
+        self.selftext = thread.comment_text(-1)
+        self.author = FakeRedditor("OriginalPoster")
+        self.link_flair_text = "Synthetic"
+        self.created_utc = thread.created_utc
+        self.num_comments = thread.n_comments
+        self.permalink = f"/r/synthetic/comments/{thread.id}/synthetic_thread/"
+        self._comments = None
+
+    @property
+    def comments(self):
+        if self._comments is None:
+            self._comments = self._thread.forest(-1, 0, self)
+        return self._comments
+
+
+class SyntheticThread:
+    def __init__(self, thread_id, n_comments, seed=0, page_size=20, max_depth=8, more_page_size=100, created_utc=None):
+        """
+        Deterministic synthetic thread. Only the parent of each comment is stored; texts and authors are
+        generated on demand, so large threads take little memory on the 'server' side.
+        """
+        self.id = thread_id
+        self.n_comments = n_comments
+        self.seed = seed
+        self.page_size = page_size            # Comments per level returned with the listing
+        self.max_depth = max_depth            # Deeper replies need a 'continue this thread' request
+        self.more_page_size = more_page_size  # Comments returned per 'load more comments' request
+        self.requests = 0
+        self.client = None                    # FakeReddit serving the thread (counts its requests)
+        self.rng = random.Random(seed)
+        # Posted at some point in the 30 days before 2025-06-15
+        self.created_utc = created_utc if created_utc is not None else 1_750_000_000 - random.Random(f"{seed}:{thread_id}:created").randrange(30 * 86400)
+
+        # Parents are chosen among earlier comments, favouring recent ones, which gives long chains and busy subtrees
+        self.parents = array("l", [-1] * n_comments)
+        for i in range(1, n_comments):
+            if self.rng.random() < 0.15:
+                self.parents[i] = -1
+            else:
+                self.parents[i] = self.rng.randrange(max(0, i - 50), i)
+
+        # Children lists in compressed form (offsets into one flat array)
+        counts = array("l", [0] * (n_comments + 1))
+        for parent in self.parents:
+            counts[parent + 1] += 1
+        self.child_offsets = array("l", [0] * (n_comments + 2))
+        for i in range(n_comments + 1):
+            self.child_offsets[i + 1] = self.child_offsets[i] + counts[i]
+        fill = array("l", self.child_offsets[:-1])
+        self.child_indices = array("l", [0] * n_comments)
+        for i, parent in enumerate(self.parents):
+            self.child_indices[fill[parent + 1]] = i
+            fill[parent + 1] += 1
+
+    def request(self):
+        self.requests += 1
+        if self.client is not None:
+            self.client.request()
+
+    def comment_id(self, index):
+        return f"{self.id}c{index}"
+
+    def comment_text(self, index):
+        rng = random.Random(f"{self.seed}:{index}:text")
+        if rng.random() < 0.03:
+            return "[removed]"
+        # Mostly short comments, some long ones (which get summarized when used as context)
+        n_words = rng.randint(150, 400) if rng.random() < 0.1 else rng.randint(3, 80)
+        return " ".join(rng.choice(WORDS) for _ in range(n_words))
+
+    def comment_author(self, index):
+        rng = random.Random(f"{self.seed}:{index}:author")
+        if rng.random() < 0.02:
+            return None  # deleted account
+        if rng.random() < 0.01:
+            return FakeRedditor("AutoModerator")
+        return FakeRedditor(f"redditor_{rng.randrange(max(1, self.n_comments // 4))}")
+
+    def children(self, index):
+        return self.child_indices[self.child_offsets[index + 1]:self.child_offsets[index + 2]].tolist()
+
+    def forest(self, index, depth, submission=None):
+        children = self.children(index)
+        if depth >= self.max_depth:
+            return FakeCommentForest(self, [FakeMoreComments(self, children, submission)] if children else [])
+        items = [FakeComment(self, child, depth, submission) for child in children[:self.page_size]]
+        if len(children) > self.page_size:
+            items.append(FakeMoreComments(self, children[self.page_size:], submission))
+        return FakeCommentForest(self, items)
+
+
+class FakeSubreddit:
+    def __init__(self, reddit, name, page_size=100):
+        self._reddit = reddit
+        self.display_name = name
+        self.page_size = page_size
+
+    def _listing(self, threads, limit):
+        # One request per page of results, like PRAW's ListingGenerator
+        threads = threads[:limit] if limit is not None else threads
+        for start in range(0, len(threads), self.page_size):
+            self._reddit.request()
+            for thread in threads[start:start + self.page_size]:
+                yield FakeSubmission(thread)
+
+    def new(self, limit=100):
+        return self._listing(sorted(self._reddit.threads.values(), key=lambda thread: thread.created_utc, reverse=True), limit)
+
+    def hot(self, limit=100):
+        # Busiest threads first
+        return self._listing(sorted(self._reddit.threads.values(), key=lambda thread: thread.n_comments, reverse=True), limit)
+
+
+class FakeReddit:
+    def __init__(self, threads, latency=0.0):
+        """
+        Stand-in for praw.Reddit serving SyntheticThreads, looked up by the id in the thread URL (every thread is
+        listed in any subreddit). Each API request sleeps for latency seconds and its time is logged.
+        """
+        self.threads = {thread.id: thread for thread in threads}
+        self.latency = latency
+        self.request_times = []
+        self._lock = threading.Lock()
+        for thread in threads:
+            thread.client = self
+
+    def request(self):
+        with self._lock:
+            self.request_times.append(time.monotonic())
+        if self.latency:
+            time.sleep(self.latency)
+
+    def max_requests(self, window=60.0):
+        """Largest number of requests sent within any window of the given length (seconds)."""
+        times = sorted(self.request_times)
+        best, first = 0, 0
+        for last in range(len(times)):
+            while times[last] - times[first] > window:
+                first += 1
+            best = max(best, last - first + 1)
+        return best
+
+    def submission(self, id=None, url=None):
+        if url is not None:
+            parts = url.rstrip("/").split("/")
+            id = parts[parts.index("comments") + 1]
+        self.request()
+        return FakeSubmission(self.threads[id])
+
+    def subreddit(self, name):
+        return FakeSubreddit(self, name)
+
+
+def synthetic_thread_url(thread_id):
+    return f"https://www.reddit.com/r/synthetic/comments/{thread_id}/synthetic_thread/"
+
+
+MAX_NEEF_CATEGORIES = [
+    "Subsistence", "Protection", "Affection", "Understanding", "Participation",
+    "Leisure", "Creativity", "Identity", "Freedom",
+]
+
+
+class FakeChatModel(Runnable):
+    def __init__(self, model="fake-llm", latency=0.0, think_words=0, seed=0):
+        """
+        Stand-in for ChatOllama/ChatOpenAI. Recognizes the prompts of the notebooks and answers with canned JSON
+        (arguments taken from the comment, motivations with random Max-Neef categories) or a short summary.
+        Each call sleeps for latency seconds; think_words adds a <think> block like deepseek-r1.
+        """
+        self.model = model
+        self.latency = latency
+        self.think_words = think_words
+        self.seed = seed
+        self.calls = 0
+
+    def invoke(self, input, config=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond(input)
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._respond(input)
+
+    def stream(self, input, config=None, **kwargs):
+        message = self._respond(input)
+        chunks = self._chunks(message)
+        for chunk in chunks:
+            if self.latency:
+                time.sleep(self.latency / len(chunks))
+            yield chunk
+
+    async def astream(self, input, config=None, **kwargs):
+        """Yields the answer a few characters at a time, spreading the latency over the chunks like a real token stream."""
+        message = self._respond(input)
+        chunks = self._chunks(message)
+        for chunk in chunks:
+            if self.latency:
+                await asyncio.sleep(self.latency / len(chunks))
+            yield chunk
+
+    @staticmethod
+    def _chunks(message, size=16):
+        content = message.content
+        pieces = [content[i:i + size] for i in range(0, len(content), size)] or [""]
+        chunks = [AIMessageChunk(content=piece) for piece in pieces]
+        # Usage comes with the last chunk, like Ollama's final stream message
+        chunks[-1] = AIMessageChunk(content=pieces[-1], response_metadata=message.response_metadata, usage_metadata=message.usage_metadata)
+        return chunks
+
+    def _respond(self, input):
+        self.calls += 1
+        prompt = input.to_string() if hasattr(input, "to_string") else str(input)
+        rng = random.Random(f"{self.seed}:{prompt}")
+        if "extract **complete arguments**" in prompt:
+            content = self._arguments(prompt, rng)
+        elif "numbered arguments" in prompt:
+            arguments = re.findall(r'^\s*(\d+)\. "', prompt.split("Arguments:")[-1], flags=re.MULTILINE)
+            content = "{" + ", ".join(f'"{i}": {self._motivations(rng)}' for i in arguments) + "}"
+        elif "underlying motivations" in prompt:
+            content = self._motivations(rng)
+        else:
+            quoted = re.findall(r'"""(.*?)"""', prompt, flags=re.DOTALL)
+            words = (quoted[-1] if quoted else prompt).split()
+            content = "Summary: " + " ".join(words[:30])
+        if self.think_words:
+            content = "<think>" + " ".join(rng.choice(WORDS) for _ in range(self.think_words)) + "</think>\n" + content
+        input_tokens = int(len(prompt.split()) * 1.3)
+        output_tokens = int(len(content.split()) * 1.3)
+        return AIMessage(
+            content=content,
+            response_metadata={"model": self.model},
+            usage_metadata={"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens},
+        )
+
+    @staticmethod
+    def _arguments(prompt, rng):
+        match = re.search(r'CURRENT COMMENT TO ANALYZE:\s*"""(.*?)"""', prompt, flags=re.DOTALL)
+        words = match.group(1).split() if match else []
+        arguments = []
+        if len(words) >= 5:
+            for _ in range(rng.randint(0, 3)):
+                start = rng.randrange(0, max(1, len(words) - 5))
+                arguments.append('{"argument": "' + " ".join(words[start:start + rng.randint(5, 15)]) + '"}')
+        return '{"arguments": [' + ", ".join(arguments) + "]}"
+
+    @staticmethod
+    def _motivations(rng):
+        motivations = []
+        for _ in range(rng.randint(1, 2)):
+            categories = ", ".join(f'"{c}"' for c in rng.sample(MAX_NEEF_CATEGORIES, rng.randint(1, 2)))
+            description = f"Concern about {rng.choice(WORDS)} and {rng.choice(WORDS)}"
+            motivations.append('{"description": "' + description + '", "max_neef_category": [' + categories + "]}")
+        return "[" + ", ".join(motivations) + "]"
+
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class InMemoryGraph:
+    def __init__(self):
+        """
+        Stand-in for Neo4jGraph. Implements the graph.query statements used by the notebooks (recognized by their
+        text) and add_graph_documents, over plain dictionaries. Unknown statements raise NotImplementedError.
+        """
+        self.nodes = {}     # id -> {"labels": set, "properties": dict}
+        self.outgoing = {}  # id -> {relationship type: set of target ids}
+        self.incoming = {}  # id -> {relationship type: set of source ids}
+        self.by_topic = {}  # topic_title -> ids of its nodes (in insertion order), like the topic_title indexes
+        self.queries = 0
+        self.similarity_scores = {}  # frozenset of two argument ids -> SIMILAR_TO score
+        # Statements of concurrent writers (upload workers) run one at a time
+        self._lock = threading.RLock()
+        self._handlers = [
+            (("CREATE CONSTRAINT",), lambda params: []),
+            (("CREATE INDEX",), lambda params: []),
+            (("CREATE VECTOR INDEX",), lambda params: []),
+            (("MATCH (n:Argument) WHERE n.embedding IS NOT NULL",), self._stored_embeddings),
+            (("CALL db.index.vector.queryNodes",), self._vector_links),
+            (("MERGE (a)-[r:SIMILAR_TO]-(b)",), self._rows_similar_to),
+            (("UNWIND $rows AS row MERGE (p:OriginalPost {id: row.id})",), self._merge_rows("OriginalPost")),
+            (("UNWIND $rows AS row MERGE (p:Comment {id: row.id})",), self._merge_rows("Comment")),
+            (("UNWIND $rows AS row MERGE (n:Argument {id: row.id})",), self._merge_rows("Argument")),
+            (("UNWIND $rows AS row MERGE (p:Post {id: row.id})",), self._merge_rows("Post")),
+            (("UNWIND $rows AS row MATCH (child:Comment {id: row.child_id})",), self._rows_responds_to),
+            (("UNWIND $rows AS row MATCH (child:Post {id: row.child_id})",), self._rows_responds_to),
+            (("UNWIND $rows AS row MATCH (child:OriginalPost {id: row.child_id})",), self._rows_responds_to),
+            (("UNWIND $rows AS row MATCH (n:Argument {id: row.argument_id})", "MERGE (p)-[:STATED]->(n)"), self._rows_stated),
+            (("UNWIND $rows AS row MERGE (s:MotivationSummary {id: row.summary_id})",), self._rows_summaries),
+            (("MERGE (m:MaxNeefCategory {id: row.category})",), self._rows_reflects),
+            (("MATCH (p)-[:STATED]->(n:Argument) DETACH DELETE n",), self._rows_invalidate),
+            (("SET p.deleted = true",), self._rows_deleted),
+            (("SET p.text_hash = row.text_hash",), self._rows_text_hash),
+            (("SET p.text_hash = $text_hash",), self._set_text_hash),
+            (("MERGE (p:OriginalPost {id: $id})",), self._merge_params("OriginalPost")),
+            (("MERGE (p:Comment {id: $id})",), self._merge_params("Comment")),
+            (("MERGE (child)-[:RESPONDS_TO]->(parent)",), self._responds_to),
+            (("-[:RESPONDS_TO*1..",), None),  # Handled in query(), needs the statement text
+            (("SET n.argument_model = $modela",), self._set_models),
+            (("MERGE (p)-[:STATED]->(n)",), self._stated),
+            (("RETURN p.id AS id, p.text_hash AS text_hash",), self._text_hashes),
+            (("MATCH (p:OriginalPost) WHERE p.topic_title = $topic_title RETURN p",), self._original_posts),
+            (("RETURN count(DISTINCT a) AS total_arguments",), self._count_arguments),
+            (("collect(DISTINCT a.motivations_descriptions) AS motivations",), self._category_motivations),
+            (("MERGE (n:MotivationSummary {id: $id})",), self._merge_summary),
+            (("RETURN mn.id AS category, s.id AS id, s.fingerprint AS fingerprint",), self._existing_summaries),
+            (("MATCH (n:MotivationSummary {id: $id}) SET",), self._update_summary),
+            (("WHERE mn.id IN $categories DETACH DELETE s",), self._delete_summaries),
+            (("WHERE s.id IN $ids DETACH DELETE s",), self._delete_summary_ids),
+            (("MERGE (a)-[:REFLECTS]->(b)",), self._summary_relation("MaxNeefCategory", "REFLECTS")),
+            (("MERGE (a)-[:SUMMARIZES]->(b)",), self._summary_relation("OriginalPost", "SUMMARIZES")),
+            (("RETURN DISTINCT p.topic_title AS topic_title",), self._topic_titles),
+            (("<-[:SUMMARIZES]-(s:MotivationSummary)",), self._snapshot_summaries),
+        ]
+        for label in ("OriginalPost", "Comment", "Post"):
+            # Snapshot export (topic_snapshot.export_topics), one statement per label
+            self._handlers.append(((f"MATCH (p:{label} {{topic_title: topic_title}})", "AS parent_id"), self._snapshot_posts(label)))
+            self._handlers.append(((f"MATCH (p:{label} {{topic_title: topic_title}})-[:STATED]->(a:Argument)",), self._snapshot_arguments(label)))
+
+    # --- storage ---
+
+    def merge_node(self, label, node_id, properties=None):
+        node = self.nodes.get(node_id)
+        if node is None:
+            node = self.nodes[node_id] = {"labels": set(), "properties": {"id": node_id}}
+        node["labels"].add(label)
+        if properties:
+            previous = node["properties"].get("topic_title")
+            node["properties"].update(properties)
+            if node["properties"].get("topic_title") != previous:
+                self.by_topic.get(previous, {}).pop(node_id, None)
+                self.by_topic.setdefault(node["properties"]["topic_title"], {})[node_id] = None
+        return node
+
+    def merge_relationship(self, source_id, rel_type, target_id):
+        self.outgoing.setdefault(source_id, {}).setdefault(rel_type, set()).add(target_id)
+        self.incoming.setdefault(target_id, {}).setdefault(rel_type, set()).add(source_id)
+
+    def delete_node(self, node_id):
+        for rel_type, targets in self.outgoing.pop(node_id, {}).items():
+            for target_id in targets:
+                self.incoming[target_id][rel_type].discard(node_id)
+        for rel_type, sources in self.incoming.pop(node_id, {}).items():
+            for source_id in sources:
+                self.outgoing[source_id][rel_type].discard(node_id)
+        node = self.nodes.pop(node_id, None)
+        if node is not None:
+            self.by_topic.get(node["properties"].get("topic_title"), {}).pop(node_id, None)
+
+    def has_label(self, node_id, *labels):
+        node = self.nodes.get(node_id)
+        return node is not None and not node["labels"].isdisjoint(labels)
+
+    def neighbours(self, node_id, rel_type=None):
+        """Ids connected to node_id in either direction (optionally through one relationship type)."""
+        result = set()
+        for adjacency in (self.outgoing, self.incoming):
+            for current_type, ids in adjacency.get(node_id, {}).items():
+                if rel_type is None or current_type == rel_type:
+                    result |= ids
+        return result
+
+    def count(self, label):
+        return sum(label in node["labels"] for node in self.nodes.values())
+
+    # --- Neo4jGraph API ---
+
+    def query(self, query, params=None):
+        params = params or {}
+        statement = " ".join(query.split())
+        with self._lock:
+            self.queries += 1
+            for fragments, handler in self._handlers:
+                if all(fragment in statement for fragment in fragments):
+                    if handler is None:
+                        return self._parents(statement, params)
+                    return handler(params)
+        raise NotImplementedError(f"InMemoryGraph does not implement: {statement}")
+
+    def add_graph_documents(self, graph_documents, include_source=False, baseEntityLabel=False):
+        with self._lock:
+            self._add_graph_documents(graph_documents)
+
+    def _add_graph_documents(self, graph_documents):
+        for doc in graph_documents:
+            for node in doc.nodes:
+                self.merge_node(node.type, node.id, node.properties)
+            for rel in doc.relationships:
+                self.merge_node(rel.source.type, rel.source.id)
+                self.merge_node(rel.target.type, rel.target.id)
+                self.merge_relationship(rel.source.id, rel.type.replace(" ", "_").upper(), rel.target.id)
+
+    # --- handlers ---
+
+    def _merge_rows(self, label):
+        def handler(params):
+            for row in params["rows"]:
+                self.merge_node(label, row["id"], {k: v for k, v in row.items() if k != "id"})
+            return []
+        return handler
+
+    def _merge_params(self, label):
+        def handler(params):
+            node = self.merge_node(label, params["id"], {k: v for k, v in params.items() if k != "id"})
+            return [{"p": dict(node["properties"])}]
+        return handler
+
+    def _find(self, node_id, *labels):
+        return node_id if self.has_label(node_id, *labels) else None
+
+    def _rows_responds_to(self, params):
+        for row in params["rows"]:
+            if self._find(row["child_id"], "Comment", "Post", "OriginalPost") and self._find(row["parent_id"], "Comment", "OriginalPost", "Post"):
+                self.merge_relationship(row["child_id"], "RESPONDS_TO", row["parent_id"])
+        return []
+
+    def _responds_to(self, params):
+        if self._find(params["child_id"], "Comment") and params["parent_id"] in self.nodes:
+            self.merge_relationship(params["child_id"], "RESPONDS_TO", params["parent_id"])
+        return []
+
+    def _rows_stated(self, params):
+        for row in params["rows"]:
+            if self._find(row["argument_id"], "Argument") and self._find(row["comment_id"], "Comment", "OriginalPost", "Post"):
+                self.merge_relationship(row["comment_id"], "STATED", row["argument_id"])
+        return []
+
+    def _stated(self, params):
+        if self._find(params["node_id"], "Argument") and self._find(params["comment_id"], "Comment", "OriginalPost"):
+            self.merge_relationship(params["comment_id"], "STATED", params["node_id"])
+        return []
+
+    def _rows_reflects(self, params):
+        for row in params["rows"]:
+            if self._find(row["argument_id"], "Argument"):
+                self.merge_node("MaxNeefCategory", row["category"])
+                self.merge_relationship(row["argument_id"], "REFLECTS", row["category"])
+        return []
+
+    def _stored_embeddings(self, params):
+        return [{"id": node_id, "embedding": node["properties"]["embedding"]} for node_id, node in self.nodes.items()
+                if "Argument" in node["labels"] and node["properties"].get("embedding") is not None]
+
+    def _link_similar(self, source_id, target_id, score):
+        # Undirected MERGE: an existing link in either direction is reused
+        if source_id not in self.outgoing.get(target_id, {}).get("SIMILAR_TO", ()):
+            self.merge_relationship(source_id, "SIMILAR_TO", target_id)
+        self.similarity_scores[frozenset((source_id, target_id))] = score
+
+    def _vector_links(self, params):
+        # Brute-force cosine similarity over every stored embedding, like the top-k of db.index.vector.queryNodes
+        stored = self._stored_embeddings(params)
+        links = set()
+        for row in params["rows"]:
+            if not self._find(row["id"], "Argument") or self.nodes[row["id"]]["properties"].get("embedding") is None:
+                continue
+            query = self.nodes[row["id"]]["properties"]["embedding"]
+            scored = sorted(((_cosine(query, other["embedding"]), other["id"]) for other in stored), reverse=True)[:params["k"]]
+            for score, other_id in scored:
+                if other_id != row["id"] and other_id not in params["batch_ids"] and score >= params["threshold"]:
+                    self._link_similar(row["id"], other_id, score)
+                    links.add(frozenset((row["id"], other_id)))
+        return [{"links": len(links)}]
+
+    def _rows_similar_to(self, params):
+        for row in params["rows"]:
+            if self._find(row["source_id"], "Argument") and self._find(row["target_id"], "Argument"):
+                self._link_similar(row["source_id"], row["target_id"], row["score"])
+        return []
+
+    def _rows_invalidate(self, params):
+        for row in params["rows"]:
+            if self._find(row["id"], "Comment", "OriginalPost"):
+                for argument_id in list(self.outgoing.get(row["id"], {}).get("STATED", ())):
+                    if self.has_label(argument_id, "Argument"):
+                        self.delete_node(argument_id)
+        return []
+
+    def _rows_deleted(self, params):
+        for row in params["rows"]:
+            if self._find(row["id"], "Comment"):
+                self.nodes[row["id"]]["properties"]["deleted"] = True
+        return []
+
+    def _rows_text_hash(self, params):
+        for row in params["rows"]:
+            self._set_text_hash({"comment_id": row["id"], "text_hash": row["text_hash"]})
+        return []
+
+    def _set_text_hash(self, params):
+        if self._find(params["comment_id"], "Comment", "OriginalPost"):
+            self.nodes[params["comment_id"]]["properties"]["text_hash"] = params["text_hash"]
+        return []
+
+    def _parents(self, statement, params):
+        max_levels = int(re.search(r"RESPONDS_TO\*1\.\.(\d+)", statement).group(1))
+        if not self._find(params["comment_id"], "Comment"):
+            return []
+        found, frontier = {}, {params["comment_id"]}
+        for depth in range(1, max_levels + 1):
+            frontier = {p for node_id in frontier for p in self.outgoing.get(node_id, {}).get("RESPONDS_TO", ())}
+            for parent_id in frontier:
+                text = self.nodes[parent_id]["properties"].get("text")
+                if self.has_label(parent_id, "Comment", "OriginalPost") and text is not None and text.lower() not in params["deleted_texts"]:
+                    found.setdefault(parent_id, (text, depth))
+        rows = [{"text": text, "id": parent_id, "depth": depth} for parent_id, (text, depth) in found.items()]
+        rows.sort(key=lambda row: len(row["text"]), reverse=True)
+        return rows
+
+    def _set_models(self, params):
+        if self._find(params["node_id"], "Argument"):
+            self.nodes[params["node_id"]]["properties"].update(argument_model=params["modela"], motivation_model=params["modelm"])
+        return []
+
+    def _topic_nodes(self, topic_title, *labels):
+        return [node_id for node_id in self.by_topic.get(topic_title, ()) if self.has_label(node_id, *labels)]
+
+    def _text_hashes(self, params):
+        rows = []
+        for node_id in self._topic_nodes(params["topic_title"], "OriginalPost", "Comment"):
+            properties = self.nodes[node_id]["properties"]
+            if "Comment" in self.nodes[node_id]["labels"] and properties.get("deleted") is not None:
+                continue
+            rows.append({"id": node_id, "text_hash": properties.get("text_hash")})
+        return rows
+
+    def _original_posts(self, params):
+        return [{"p": dict(self.nodes[node_id]["properties"])} for node_id in self._topic_nodes(params["topic_title"], "OriginalPost")]
+
+    def _topic_arguments(self, topic_title):
+        # Arguments connected to a Post/OriginalPost of the topic, like (a:Argument)--(p) in the summarizer queries
+        return {
+            argument_id
+            for node_id in self._topic_nodes(topic_title, "Post", "OriginalPost")
+            for argument_id in self.neighbours(node_id)
+            if self.has_label(argument_id, "Argument")
+        }
+
+    def _count_arguments(self, params):
+        return [{"total_arguments": len(self._topic_arguments(params["topic_title"]))}]
+
+    def _category_motivations(self, params):
+        by_category = {}
+        for argument_id in self._topic_arguments(params["topic_title"]):
+            for category_id in self.neighbours(argument_id):
+                if self.has_label(category_id, "MaxNeefCategory"):
+                    by_category.setdefault(category_id, []).append(argument_id)
+        rows = []
+        for category_id in sorted(by_category):
+            motivations = []
+            for argument_id in by_category[category_id]:
+                descriptions = self.nodes[argument_id]["properties"].get("motivations_descriptions")
+                if descriptions is not None and descriptions not in motivations:
+                    motivations.append(descriptions)
+            rows.append({"category": category_id, "motivations": motivations, "argument_count": len(by_category[category_id]),
+                         "argument_ids": sorted(by_category[category_id])})
+        return rows
+
+    def _merge_summary(self, params):
+        self.merge_node("MotivationSummary", params["id"], {k: v for k, v in params.items() if k != "id"})
+        return []
+
+    def _existing_summaries(self, params):
+        rows = []
+        for summary_id in self.incoming.get(params["post_id"], {}).get("SUMMARIZES", ()):
+            for category_id in self.outgoing.get(summary_id, {}).get("REFLECTS", ()):
+                if self.has_label(category_id, "MaxNeefCategory"):
+                    fingerprint = self.nodes[summary_id]["properties"].get("fingerprint")
+                    rows.append({"category": category_id, "id": summary_id, "fingerprint": fingerprint})
+        return sorted(rows, key=lambda row: (row["category"], row["id"]))
+
+    def _delete_summaries(self, params):
+        for row in self._existing_summaries(params):
+            if row["category"] in params["categories"]:
+                self.delete_node(row["id"])
+        return []
+
+    def _delete_summary_ids(self, params):
+        for summary_id in params["ids"]:
+            if self._find(summary_id, "MotivationSummary"):
+                self.delete_node(summary_id)
+        return []
+
+    def _update_summary(self, params):
+        if self._find(params["id"], "MotivationSummary"):
+            self.nodes[params["id"]]["properties"].update({k: v for k, v in params.items() if k != "id"})
+        return []
+
+    def _summary_relation(self, target_label, rel_type):
+        def handler(params):
+            source_id = params["novo_id"]
+            target_id = params["categoria_id"] if target_label == "MaxNeefCategory" else params["post_id"]
+            if self._find(source_id, "MotivationSummary") and self._find(target_id, target_label):
+                self.merge_relationship(source_id, rel_type, target_id)
+            return []
+        return handler
+
+    def _rows_summaries(self, params):
+        for row in params["rows"]:
+            properties = {k: row[k] for k in ("description", "n_arguments_analyzed", "n_arguments_used", "presence", "fingerprint")}
+            self.merge_node("MotivationSummary", row["summary_id"], properties)
+            if self._find(row["post_id"], "OriginalPost"):
+                self.merge_relationship(row["summary_id"], "SUMMARIZES", row["post_id"])
+                if row["category"] is not None:
+                    self.merge_node("MaxNeefCategory", row["category"])
+                    self.merge_relationship(row["summary_id"], "REFLECTS", row["category"])
+        return []
+
+    def _topic_titles(self, params):
+        titles = {node["properties"].get("topic_title") for node in self.nodes.values() if "OriginalPost" in node["labels"]}
+        return [{"topic_title": title} for title in titles if title is not None]
+
+    def _snapshot_posts(self, label):
+        def handler(params):
+            rows = []
+            for topic_title in params["topic_titles"]:
+                for node_id in self._topic_nodes(topic_title, label):
+                    properties = self.nodes[node_id]["properties"]
+                    if label == "Comment" and properties.get("deleted") is not None:
+                        continue
+                    parents = sorted(self.outgoing.get(node_id, {}).get("RESPONDS_TO", ())) or [None]
+                    for parent_id in parents:
+                        rows.append({"topic_title": topic_title, "post_id": node_id, "label": label, "parent_id": parent_id,
+                                     "author": properties.get("author"), "text": properties.get("text"),
+                                     "text_hash": properties.get("text_hash"), "tags": properties.get("tags")})
+            return rows
+        return handler
+
+    def _snapshot_arguments(self, label):
+        def handler(params):
+            rows = []
+            for topic_title in params["topic_titles"]:
+                for node_id in self._topic_nodes(topic_title, label):
+                    for argument_id in sorted(self.outgoing.get(node_id, {}).get("STATED", ())):
+                        if not self.has_label(argument_id, "Argument"):
+                            continue
+                        properties = self.nodes[argument_id]["properties"]
+                        categories = [c for c in sorted(self.outgoing.get(argument_id, {}).get("REFLECTS", ())) if self.has_label(c, "MaxNeefCategory")]
+                        rows.append({"topic_title": topic_title, "post_id": node_id, "post_label": label, "argument_id": argument_id,
+                                     "description": properties.get("description"), "motivations": properties.get("motivations_descriptions"),
+                                     "argument_model": properties.get("argument_model"), "motivation_model": properties.get("motivation_model"),
+                                     "categories": categories})
+            return rows
+        return handler
+
+    def _snapshot_summaries(self, params):
+        rows = []
+        for topic_title in params["topic_titles"]:
+            for post_id in self._topic_nodes(topic_title, "OriginalPost"):
+                for summary_id in sorted(self.incoming.get(post_id, {}).get("SUMMARIZES", ())):
+                    if not self.has_label(summary_id, "MotivationSummary"):
+                        continue
+                    properties = self.nodes[summary_id]["properties"]
+                    categories = [c for c in sorted(self.outgoing.get(summary_id, {}).get("REFLECTS", ())) if self.has_label(c, "MaxNeefCategory")]
+                    for category in categories or [None]:
+                        rows.append({"topic_title": topic_title, "post_id": post_id, "summary_id": summary_id, "category": category,
+                                     **{k: properties.get(k) for k in ("description", "n_arguments_analyzed", "n_arguments_used", "presence", "fingerprint")}})
+        return rows
@@ -0,0 +1,91 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+# Prompt shared by main.ipynb and evaluator.ipynb, so that both reuse the same cached summaries.
+# Bump the version whenever the prompt changes, so that old summaries are not reused.
+SUMMARY_PROMPT_VERSION = "v1"
+SUMMARY_PROMPT = """
+        Summarize the following comment in a concise and informative way. If you refer to the author, make sure you refer to them as 'an author of previous comments'. Only keep what is essential to understand the point made, and return only the summary:
+
+        \"\"\"{text}\"\"\"
+        """
+
+
+class SummaryCache:
+    def __init__(self, path="cache/summaries.sqlite", max_entries=50_000):
+        """Opens (or creates) a disk-backed summary cache with least-recently-used eviction."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS summaries (
+                key TEXT PRIMARY KEY,
+                summary TEXT NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS summaries_last_used ON summaries (last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(text, model, prompt_version):
+        """Hash of the text plus the summarizer model and prompt version."""
+        return hashlib.sha256(f"{model}\x00{prompt_version}\x00{text}".encode("utf-8")).hexdigest()
+
+    def get(self, text, model, prompt_version=SUMMARY_PROMPT_VERSION):
+        """Returns the cached summary, or None if it was never stored."""
+        key = self.make_key(text, model, prompt_version)
+        with self._lock:
+            row = self._conn.execute("SELECT summary FROM summaries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE summaries SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, text, model, summary, prompt_version=SUMMARY_PROMPT_VERSION):
+        """Stores a summary, evicting the least recently used ones when the cache is full."""
+        key = self.make_key(text, model, prompt_version)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries (key, summary, last_used) VALUES (?, ?, ?)",
+                (key, summary, time.time())
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+            if count > self.max_entries:
+                # Evict a little more than needed, so that eviction does not run on every insertion
+                excess = count - self.max_entries + max(1, self.max_entries // 10)
+                self._conn.execute(
+                    "DELETE FROM summaries WHERE key IN (SELECT key FROM summaries ORDER BY last_used LIMIT ?)",
+                    (excess,)
+                )
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+
+    def stats(self):
+        """Returns hit/miss counters for this session and the number of stored summaries."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self),
+        }
+
+    def close(self):
+        self._conn.close()
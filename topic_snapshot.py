@@ -0,0 +1,409 @@
+import json
+import os
+import shutil
+import time
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# Columnar snapshots of processed topics: one file per table, written topic batch by topic batch.
+# "arrow" files (Arrow IPC, uncompressed) are memory-mapped and read without copying;
+# "parquet" files are smaller, for archiving or other tools, but are decoded into memory when read.
+SNAPSHOT_VERSION = 2  # 2: text_hash and tags of the posts
+SNAPSHOT_FORMATS = {"arrow": ".arrow", "parquet": ".parquet"}
+
+# Labels of the nodes holding the text of a topic (Post is used by the older versions of the pipeline)
+POST_LABELS = ("OriginalPost", "Comment", "Post")
+
+# Cleaned text of comments that were deleted or removed on Reddit (same set as the scraper in main.ipynb)
+DELETED_TEXTS = {"deleted", "removed"}
+
+SCHEMAS = {
+    "posts": pa.schema([
+        ("topic_title", pa.string()),
+        ("post_id", pa.string()),
+        ("label", pa.string()),
+        ("parent_id", pa.string()),
+        ("author", pa.string()),
+        ("text", pa.string()),
+        ("text_hash", pa.string()),  # None until the comment's arguments were uploaded (main.ipynb re-extracts it)
+        ("tags", pa.list_(pa.string())),  # Original posts only
+    ]),
+    "arguments": pa.schema([
+        ("topic_title", pa.string()),
+        ("argument_id", pa.string()),
+        ("post_id", pa.string()),
+        ("post_label", pa.string()),
+        ("description", pa.string()),
+        ("argument_model", pa.string()),
+        ("motivation_model", pa.string()),
+    ]),
+    # One row per motivation description of an argument (Argument.motivations_descriptions)
+    "motivations": pa.schema([
+        ("topic_title", pa.string()),
+        ("argument_id", pa.string()),
+        ("position", pa.int32()),
+        ("description", pa.string()),
+    ]),
+    # REFLECTS edges from the arguments to the Max-Neef categories
+    "categories": pa.schema([
+        ("topic_title", pa.string()),
+        ("argument_id", pa.string()),
+        ("category", pa.string()),
+    ]),
+    "summaries": pa.schema([
+        ("topic_title", pa.string()),
+        ("summary_id", pa.string()),
+        ("post_id", pa.string()),
+        ("category", pa.string()),
+        ("description", pa.string()),
+        ("n_arguments_analyzed", pa.int64()),
+        ("n_arguments_used", pa.int64()),
+        ("presence", pa.float64()),
+        ("fingerprint", pa.string()),
+    ]),
+}
+
+
+def _posts_query(label):
+    # Anchored on the label and topic_title (indexed by BulkGraphWriter.create_constraints), relationships with their direction
+    deleted = "WHERE p.deleted IS NULL" if label == "Comment" else ""
+    return f"""
+        UNWIND $topic_titles AS topic_title
+        MATCH (p:{label} {{topic_title: topic_title}})
+        {deleted}
+        OPTIONAL MATCH (p)-[:RESPONDS_TO]->(parent)
+        RETURN topic_title, p.id AS post_id, '{label}' AS label, parent.id AS parent_id, p.author AS author, p.text AS text,
+               p.text_hash AS text_hash, p.tags AS tags
+        """
+
+
+def _arguments_query(label):
+    return f"""
+        UNWIND $topic_titles AS topic_title
+        MATCH (p:{label} {{topic_title: topic_title}})-[:STATED]->(a:Argument)
+        OPTIONAL MATCH (a)-[:REFLECTS]->(mn:MaxNeefCategory)
+        RETURN topic_title, p.id AS post_id, '{label}' AS post_label, a.id AS argument_id, a.description AS description,
+               a.motivations_descriptions AS motivations, a.argument_model AS argument_model,
+               a.motivation_model AS motivation_model, collect(mn.id) AS categories
+        """
+
+
+SUMMARIES_QUERY = """
+    UNWIND $topic_titles AS topic_title
+    MATCH (p:OriginalPost {topic_title: topic_title})<-[:SUMMARIZES]-(s:MotivationSummary)
+    OPTIONAL MATCH (s)-[:REFLECTS]->(mn:MaxNeefCategory)
+    RETURN topic_title, p.id AS post_id, s.id AS summary_id, mn.id AS category, s.description AS description,
+           s.n_arguments_analyzed AS n_arguments_analyzed, s.n_arguments_used AS n_arguments_used,
+           s.presence AS presence, s.fingerprint AS fingerprint
+    """
+
+
+def list_topics(graph):
+    """Topic titles of every original post in the graph."""
+    rows = graph.query("MATCH (p:OriginalPost) WHERE p.topic_title IS NOT NULL RETURN DISTINCT p.topic_title AS topic_title")
+    return sorted(row["topic_title"] for row in rows)
+
+
+class _TableWriter:
+    def __init__(self, path, schema, format):
+        self.path = path
+        self.schema = schema
+        self.rows = 0
+        if format == "arrow":
+            self._sink = pa.OSFile(path, "wb")
+            self._writer = pa.ipc.new_file(self._sink, schema)
+        else:
+            self._sink = None
+            self._writer = pq.ParquetWriter(path, schema)
+
+    def write(self, rows):
+        if rows:
+            self._writer.write_table(pa.Table.from_pylist(rows, schema=self.schema))
+            self.rows += len(rows)
+
+    def close(self):
+        self._writer.close()
+        if self._sink is not None:
+            self._sink.close()
+
+
+def export_topics(graph, topic_titles, directory, format="arrow", topics_per_batch=50):
+    """
+    Writes the posts, arguments, motivations, category edges and summaries of the given topics to a snapshot
+    directory (replaced as a whole once complete). Topics are queried topics_per_batch at a time, and their rows
+    are appended to the files batch by batch, so the snapshot of thousands of topics is never held in memory.
+    Returns the number of rows per table.
+    """
+    if format not in SNAPSHOT_FORMATS:
+        raise ValueError(f"Unknown snapshot format '{format}', expected one of {tuple(SNAPSHOT_FORMATS)}")
+    topic_titles = list(topic_titles)
+    tmp_directory = directory.rstrip("/") + ".tmp"
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.makedirs(tmp_directory)
+    writers = {name: _TableWriter(os.path.join(tmp_directory, name + SNAPSHOT_FORMATS[format]), schema, format)
+               for name, schema in SCHEMAS.items()}
+    try:
+        for start in range(0, len(topic_titles), topics_per_batch):
+            params = {"topic_titles": topic_titles[start:start + topics_per_batch]}
+            writers["posts"].write([row for label in POST_LABELS for row in graph.query(_posts_query(label), params)])
+
+            arguments, motivations, categories = [], [], []
+            seen = set()
+            for label in POST_LABELS:
+                for row in graph.query(_arguments_query(label), params):
+                    arguments.append({key: row[key] for key in SCHEMAS["arguments"].names})
+                    if row["argument_id"] in seen:
+                        continue  # Argument stated in several posts: one row per post, its motivations and categories once
+                    seen.add(row["argument_id"])
+                    for position, description in enumerate(row["motivations"] or []):
+                        motivations.append({"topic_title": row["topic_title"], "argument_id": row["argument_id"],
+                                            "position": position, "description": description})
+                    for category in dict.fromkeys(row["categories"]):
+                        categories.append({"topic_title": row["topic_title"], "argument_id": row["argument_id"], "category": category})
+            writers["arguments"].write(arguments)
+            writers["motivations"].write(motivations)
+            writers["categories"].write(categories)
+            writers["summaries"].write(graph.query(SUMMARIES_QUERY, params))
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    counts = {name: writer.rows for name, writer in writers.items()}
+    with open(os.path.join(tmp_directory, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"version": SNAPSHOT_VERSION, "format": format, "created": time.time(), "topics": topic_titles, "rows": counts}, f, indent=2)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp_directory, directory)
+    return counts
+
+
+class TopicSnapshot:
+    def __init__(self, directory):
+        """
+        Opens a snapshot written by export_topics. Arrow files are memory-mapped: columns point into the page cache
+        and only the pages that are touched are read from disk.
+        """
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta["version"] != SNAPSHOT_VERSION:
+            raise ValueError(f"Snapshot version {self.meta['version']} is not supported (expected {SNAPSHOT_VERSION})")
+        extension = SNAPSHOT_FORMATS[self.meta["format"]]
+        self.tables = {}
+        for name in SCHEMAS:
+            path = os.path.join(directory, name + extension)
+            if extension == ".arrow":
+                self.tables[name] = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+            else:
+                self.tables[name] = pq.read_table(path, memory_map=True)
+        self._post_rows = None
+
+    def topics(self):
+        return list(self.meta["topics"])
+
+    def _topic(self, name, topic_title):
+        table = self.tables[name]
+        return table.filter(pc.equal(table["topic_title"], topic_title))
+
+    def _topic_arguments(self, topic_title, post_labels):
+        arguments = self._topic("arguments", topic_title)
+        return arguments.filter(pc.is_in(arguments["post_label"], value_set=pa.array(list(post_labels), pa.string())))
+
+    def _by_argument(self, name, topic_title, argument_ids):
+        table = self._topic(name, topic_title)
+        return table.filter(pc.is_in(table["argument_id"], value_set=argument_ids))
+
+    # --- the reads of summarizer.ipynb ---
+
+    def original_post_id(self, topic_title):
+        posts = self._topic("posts", topic_title)
+        posts = posts.filter(pc.equal(posts["label"], "OriginalPost"))
+        return posts["post_id"][0].as_py() if posts.num_rows else None
+
+    def count_topic_arguments(self, topic_title, post_labels=POST_LABELS):
+        return pc.count_distinct(self._topic_arguments(topic_title, post_labels)["argument_id"]).as_py()
+
+    def category_motivations(self, topic_title, post_labels=POST_LABELS):
+        """Same rows as get_category_motivations: category, distinct motivation lists, argument count and ids, by category."""
+        argument_ids = self._topic_arguments(topic_title, post_labels)["argument_id"].combine_chunks()
+        descriptions = {}
+        for row in self._by_argument("motivations", topic_title, argument_ids).sort_by([("argument_id", "ascending"), ("position", "ascending")]).to_pylist():
+            descriptions.setdefault(row["argument_id"], []).append(row["description"])
+        by_category = {}
+        for row in self._by_argument("categories", topic_title, argument_ids).to_pylist():
+            by_category.setdefault(row["category"], set()).add(row["argument_id"])
+        rows = []
+        for category in sorted(by_category):
+            argument_ids = sorted(by_category[category])
+            motivations = []
+            for argument_id in argument_ids:
+                if argument_id in descriptions and descriptions[argument_id] not in motivations:
+                    motivations.append(descriptions[argument_id])
+            rows.append({"category": category, "motivations": motivations, "argument_count": len(argument_ids), "argument_ids": argument_ids})
+        return rows
+
+    def category_presence(self, topic_titles=None, post_labels=POST_LABELS):
+        """
+        Arguments per (topic, category) and their presence (share of the topic's arguments), for every topic
+        of the snapshot (or the given ones) at once, as a table sorted by topic and category.
+        """
+        arguments = self.tables["arguments"]
+        arguments = arguments.filter(pc.is_in(arguments["post_label"], value_set=pa.array(list(post_labels), pa.string())))
+        edges = self.tables["categories"]
+        edges = edges.filter(pc.is_in(edges["argument_id"], value_set=arguments["argument_id"].combine_chunks()))
+        if topic_titles is not None:
+            titles = pa.array(list(topic_titles), pa.string())
+            edges = edges.filter(pc.is_in(edges["topic_title"], value_set=titles))
+            arguments = arguments.filter(pc.is_in(arguments["topic_title"], value_set=titles))
+        counts = edges.group_by(["topic_title", "category"]).aggregate([("argument_id", "count_distinct")])
+        counts = counts.rename_columns(["topic_title", "category", "argument_count"])
+        totals = arguments.group_by("topic_title").aggregate([("argument_id", "count_distinct")])
+        totals = totals.rename_columns(["topic_title", "total_arguments"])
+        table = counts.join(totals, "topic_title")
+        presence = pc.divide(pc.cast(table["argument_count"], pa.float64()), pc.cast(table["total_arguments"], pa.float64()))
+        return table.append_column("presence", presence).sort_by([("topic_title", "ascending"), ("category", "ascending")])
+
+    # --- the reads of evaluator.ipynb ---
+
+    def argument_records(self, topic_title, post_labels=POST_LABELS):
+        """Same records as get_nodes_by_topic_title (evaluator.ipynb): one per argument with its post text, motivations and categories, by argument id."""
+        arguments = self._topic_arguments(topic_title, post_labels)
+        argument_ids = arguments["argument_id"].combine_chunks()
+        texts = {row["post_id"]: row["text"] for row in self._topic("posts", topic_title).select(["post_id", "text"]).to_pylist()}
+        descriptions, categories = {}, {}
+        for row in self._by_argument("motivations", topic_title, argument_ids).sort_by([("argument_id", "ascending"), ("position", "ascending")]).to_pylist():
+            descriptions.setdefault(row["argument_id"], []).append(row["description"])
+        for row in self._by_argument("categories", topic_title, argument_ids).to_pylist():
+            categories.setdefault(row["argument_id"], []).append(row["category"])
+        records = []
+        for row in arguments.sort_by("argument_id").to_pylist():
+            if row["argument_id"] not in categories:
+                continue  # Like the MATCH on (a)-[]-(mn:MaxNeefCategory)
+            records.append({
+                "argument_id": row["argument_id"],
+                "post_id": row["post_id"],
+                "post_text": texts.get(row["post_id"]),
+                "descriptions": row["description"],
+                "motivations": descriptions.get(row["argument_id"], []),
+                "categories": sorted(categories[row["argument_id"]]),
+            })
+        return records
+
+    def _post_row(self, post_id):
+        if self._post_rows is None:
+            # Built on the first lookup, from a single column
+            self._post_rows = {value: i for i, value in enumerate(self.tables["posts"]["post_id"].to_pylist())}
+        return self._post_rows.get(post_id)
+
+    def post(self, post_id):
+        i = self._post_row(post_id)
+        return self.tables["posts"].slice(i, 1).to_pylist()[0] if i is not None else None
+
+    def post_text(self, post_id):
+        post = self.post(post_id)
+        return post["text"] if post is not None else None
+
+    def parent_posts(self, post_id, max_levels=3, post_labels=POST_LABELS):
+        """Parents of a post (up to max_levels), like get_parent_posts: {"id", "text", "depth"}, longest text first."""
+        parents = []
+        post = self.post(post_id)
+        for depth in range(1, max_levels + 1):
+            post = self.post(post["parent_id"]) if post is not None and post["parent_id"] is not None else None
+            if post is None:
+                break
+            if post["label"] in post_labels and post["text"] is not None and post["text"].lower() not in DELETED_TEXTS:
+                parents.append({"id": post["post_id"], "text": post["text"], "depth": depth})
+        parents.sort(key=lambda p: len(p["text"]), reverse=True)
+        return parents
+
+
+def import_snapshot(graph, directory, topic_titles=None, batch_size=1000):
+    """
+    Loads a snapshot (or some of its topics) back into the graph, e.g. a Neo4j instance restored for another analysis.
+    Nodes are merged by id, so importing a topic again updates it. Returns the number of rows per table.
+    """
+    snapshot = TopicSnapshot(directory)
+    tables = dict(snapshot.tables)
+    if topic_titles is not None:
+        titles = pa.array(list(topic_titles), pa.string())
+        tables = {name: table.filter(pc.is_in(table["topic_title"], value_set=titles)) for name, table in tables.items()}
+
+    def run(query, rows):
+        for start in range(0, len(rows), batch_size):
+            graph.query(query, {"rows": rows[start:start + batch_size]})
+
+    posts = tables["posts"].to_pylist()
+    for label in POST_LABELS:
+        # Each post keeps its label; the text hashes let main.ipynb tell unchanged comments from new or edited ones
+        rows = [{"id": p["post_id"], "text": p["text"], "text_hash": p["text_hash"], "author": p["author"],
+                 "topic_title": p["topic_title"], "tags": p["tags"]}
+                for p in posts if p["label"] == label]
+        tags = ",\n                p.tags = row.tags" if label == "OriginalPost" else ""
+        run(f"""
+            UNWIND $rows AS row
+            MERGE (p:{label} {{id: row.id}})
+            SET p.text = row.text,
+                p.text_hash = row.text_hash,
+                p.author = row.author,
+                p.topic_title = row.topic_title{tags}
+            """, rows)
+    for label in POST_LABELS:
+        rows = [{"child_id": p["post_id"], "parent_id": p["parent_id"]} for p in posts if p["label"] == label and p["parent_id"] is not None]
+        run(f"""
+            UNWIND $rows AS row
+            MATCH (child:{label} {{id: row.child_id}})
+            OPTIONAL MATCH (parent_comment:Comment {{id: row.parent_id}})
+            OPTIONAL MATCH (parent_post:OriginalPost {{id: row.parent_id}})
+            OPTIONAL MATCH (parent_legacy:Post {{id: row.parent_id}})
+            WITH child, coalesce(parent_comment, parent_post, parent_legacy) AS parent
+            WHERE parent IS NOT NULL
+            MERGE (child)-[:RESPONDS_TO]->(parent)
+            """, rows)
+
+    descriptions = {}
+    for row in tables["motivations"].sort_by([("argument_id", "ascending"), ("position", "ascending")]).to_pylist():
+        descriptions.setdefault(row["argument_id"], []).append(row["description"])
+    arguments = tables["arguments"].to_pylist()
+    run("""
+        UNWIND $rows AS row
+        MERGE (n:Argument {id: row.id})
+        SET n.description = row.description,
+            n.motivations_descriptions = row.motivations_descriptions,
+            n.argument_model = row.argument_model,
+            n.motivation_model = row.motivation_model
+        """, [{"id": a["argument_id"], "description": a["description"], "motivations_descriptions": descriptions.get(a["argument_id"], []),
+               "argument_model": a["argument_model"], "motivation_model": a["motivation_model"]} for a in arguments])
+    run("""
+        UNWIND $rows AS row
+        MATCH (n:Argument {id: row.argument_id})
+        OPTIONAL MATCH (comment:Comment {id: row.comment_id})
+        OPTIONAL MATCH (post:OriginalPost {id: row.comment_id})
+        OPTIONAL MATCH (legacy:Post {id: row.comment_id})
+        WITH n, coalesce(comment, post, legacy) AS p
+        WHERE p IS NOT NULL
+        MERGE (p)-[:STATED]->(n)
+        """, [{"argument_id": a["argument_id"], "comment_id": a["post_id"]} for a in arguments])
+    run("""
+        UNWIND $rows AS row
+        MATCH (n:Argument {id: row.argument_id})
+        MERGE (m:MaxNeefCategory {id: row.category})
+        MERGE (n)-[:REFLECTS]->(m)
+        """, tables["categories"].select(["argument_id", "category"]).to_pylist())
+    run("""
+        UNWIND $rows AS row
+        MERGE (s:MotivationSummary {id: row.summary_id})
+        SET s.description = row.description,
+            s.n_arguments_analyzed = row.n_arguments_analyzed,
+            s.n_arguments_used = row.n_arguments_used,
+            s.presence = row.presence,
+            s.fingerprint = row.fingerprint
+        WITH s, row
+        MATCH (p:OriginalPost {id: row.post_id})
+        MERGE (s)-[:SUMMARIZES]->(p)
+        WITH s, row
+        WHERE row.category IS NOT NULL
+        MERGE (c:MaxNeefCategory {id: row.category})
+        MERGE (s)-[:REFLECTS]->(c)
+        """, tables["summaries"].to_pylist())
+    return {name: table.num_rows for name, table in tables.items()}
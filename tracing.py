@@ -0,0 +1,246 @@
+import atexit
+import contextvars
+import functools
+import inspect
+import itertools
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the stage duration histogram buckets
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Counters aggregated per stage and model, besides the durations
+COUNTERS = ("prompt_tokens", "completion_tokens", "think_tokens", "cache_hits", "retries", "parse_failures")
+
+_THINK_PATTERN = re.compile(r"<think>(.*?)</think>", re.DOTALL)
+
+# Innermost open span of the current thread/task (asyncio tasks get their own copy)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("id", "parent_id", "stage", "model", "start", "attributes", "counters")
+
+    def __init__(self, span_id, parent, stage, attributes):
+        self.id = span_id
+        self.parent_id = parent.id if parent is not None else None
+        self.stage = stage
+        # Nested spans (e.g. parsing inside an extraction) are attributed to the model of their parent
+        self.model = parent.model if parent is not None else ""
+        self.start = time.time()
+        self.attributes = attributes
+        self.counters = {}
+
+
+class Tracer:
+    def __init__(self, path=None, enabled=True, flush_every=200, buckets=DEFAULT_BUCKETS):
+        """
+        Records one span per pipeline stage execution (wall time, model, tokens, retries, parse failures).
+        Spans are buffered and appended to a JSONL file every flush_every spans; aggregated metrics are kept
+        in memory and can be exported as a Prometheus text-format snapshot.
+        """
+        self.path = path or f"out/traces/spans-{time.strftime('%Y%m%d-%H%M%S')}.jsonl"
+        self.enabled = enabled
+        self.flush_every = flush_every
+        self.buckets = buckets
+        self.metrics = {}  # (stage, model) -> aggregated values
+        self._buffer = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+
+    @contextmanager
+    def span(self, stage, **attributes):
+        if not self.enabled:
+            yield None
+            return
+        span = Span(next(self._ids), _current_span.get(), stage, attributes)
+        token = _current_span.set(span)
+        start = time.perf_counter()
+        error = None
+        try:
+            yield span
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            _current_span.reset(token)
+            self._finish(span, duration, error)
+
+    @contextmanager
+    def paused(self):
+        """Records nothing inside the block (e.g. a benchmark with stand-ins), then restores the previous state."""
+        enabled, self.enabled = self.enabled, False
+        try:
+            yield
+        finally:
+            self.enabled = enabled
+
+    def trace(self, stage):
+        """Decorator running every call of a function (sync or async) in a span."""
+        def decorator(func):
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.span(stage):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def annotate(self, **attributes):
+        """Adds attributes to the current span."""
+        span = _current_span.get()
+        if span is not None:
+            span.attributes.update(attributes)
+
+    def count(self, name, value=1):
+        """Increments a counter (see COUNTERS) of the current span."""
+        span = _current_span.get()
+        if span is not None:
+            span.counters[name] = span.counters.get(name, 0) + value
+
+    def record_llm_response(self, response, prompt_tokens=None):
+        """
+        Adds the model and token usage of an LLM response (AIMessage) to the current span.
+        Tokens inside <think> blocks are estimated from their share of the answer.
+        Answers from the LLM cache are counted as cache hits, without tokens.
+        """
+        span = _current_span.get()
+        if span is None:
+            return
+        metadata = getattr(response, "response_metadata", None) or {}
+        span.model = metadata.get("model") or metadata.get("model_name") or span.model
+        if metadata.get("cache_hit"):
+            self.count("cache_hits")
+            return
+        usage = getattr(response, "usage_metadata", None) or {}
+        content = response.content if isinstance(response.content, str) else ""
+        completion_tokens = usage.get("output_tokens") or int(len(content.split()) * 1.3)
+        think_chars = sum(len(think) for think in _THINK_PATTERN.findall(content))
+        self.count("prompt_tokens", usage.get("input_tokens") or prompt_tokens or 0)
+        self.count("completion_tokens", completion_tokens)
+        if think_chars:
+            self.count("think_tokens", round(completion_tokens * think_chars / len(content)))
+
+    def _metric(self, stage, model):
+        metric = self.metrics.get((stage, model))
+        if metric is None:
+            metric = self.metrics[(stage, model)] = {
+                "count": 0,
+                "errors": 0,
+                "seconds": 0.0,
+                "buckets": [0] * len(self.buckets),
+                **{name: 0 for name in COUNTERS},
+            }
+        return metric
+
+    def _finish(self, span, duration, error):
+        record = {
+            "span_id": span.id,
+            "parent_id": span.parent_id,
+            "stage": span.stage,
+            "model": span.model,
+            "start": span.start,
+            "duration_s": duration,
+        }
+        if span.attributes:
+            record["attributes"] = span.attributes
+        if span.counters:
+            record["counters"] = span.counters
+        if error:
+            record["error"] = error
+
+        with self._lock:
+            metric = self._metric(span.stage, span.model)
+            metric["count"] += 1
+            metric["seconds"] += duration
+            if error:
+                metric["errors"] += 1
+            for i, bound in enumerate(self.buckets):
+                if duration <= bound:
+                    metric["buckets"][i] += 1
+                    break
+            for name, value in span.counters.items():
+                metric[name] = metric.get(name, 0) + value
+            self._buffer.append(record)
+            if len(self._buffer) >= self.flush_every:
+                self._write(self._buffer)
+                self._buffer = []
+
+    def _write(self, records):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(record, default=str) + "\n" for record in records))
+
+    def flush(self):
+        with self._lock:
+            if self._buffer:
+                self._write(self._buffer)
+                self._buffer = []
+
+    def prometheus_snapshot(self):
+        """Aggregated metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = {key: dict(value, buckets=list(value["buckets"])) for key, value in self.metrics.items()}
+        lines = [
+            "# HELP pipeline_stage_seconds Wall time of pipeline stages.",
+            "# TYPE pipeline_stage_seconds histogram",
+        ]
+        for (stage, model), metric in sorted(metrics.items()):
+            labels = f'stage="{stage}",model="{model}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, metric["buckets"]):
+                cumulative += count
+                lines.append(f'pipeline_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'pipeline_stage_seconds_bucket{{{labels},le="+Inf"}} {metric["count"]}')
+            lines.append(f"pipeline_stage_seconds_sum{{{labels}}} {metric['seconds']:.6f}")
+            lines.append(f"pipeline_stage_seconds_count{{{labels}}} {metric['count']}")
+
+        counters = [
+            ("pipeline_stage_errors_total", "Stage executions that raised an exception.", lambda m: m["errors"]),
+            ("pipeline_llm_prompt_tokens_total", "Prompt tokens sent to the LLM.", lambda m: m["prompt_tokens"]),
+            ("pipeline_llm_completion_tokens_total", "Completion tokens returned by the LLM.", lambda m: m["completion_tokens"]),
+            ("pipeline_llm_think_tokens_total", "Completion tokens spent inside <think> blocks.", lambda m: m["think_tokens"]),
+            ("pipeline_llm_cache_hits_total", "LLM answers served from the response cache.", lambda m: m["cache_hits"]),
+            ("pipeline_llm_retries_total", "Retried LLM calls.", lambda m: m["retries"]),
+            ("pipeline_parse_failures_total", "LLM answers without valid JSON.", lambda m: m["parse_failures"]),
+        ]
+        for name, help_text, value in counters:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for (stage, model), metric in sorted(metrics.items()):
+                lines.append(f'{name}{{stage="{stage}",model="{model}"}} {value(metric)}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path="out/traces/metrics.prom"):
+        """Writes the snapshot atomically, e.g. to a file read by node_exporter's textfile collector."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(self.prometheus_snapshot())
+        os.replace(path + ".tmp", path)
+        return path
+
+    def report(self):
+        """Prints the stages sorted by total wall time, per model, to spot the bottleneck (nested spans are included in their parents' time)."""
+        with self._lock:
+            metrics = sorted(self.metrics.items(), key=lambda item: item[1]["seconds"], reverse=True)
+        for (stage, model), metric in metrics:
+            think = f", {metric['think_tokens'] / metric['completion_tokens']:.0%} thinking" if metric["completion_tokens"] else ""
+            print(f"{stage:>20} {model or '-':>16}: {metric['count']} spans, {metric['seconds']:.2f}s, "
+                  f"{metric['prompt_tokens']} prompt / {metric['completion_tokens']} completion tokens{think}, {metric['cache_hits']} cache hits, "
+                  f"{metric['retries']} retries, {metric['parse_failures']} parse failures, {metric['errors']} errors")